@@ -1,31 +1,32 @@
 # app.py  
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, redirect, url_for, flash, session
 import os
 import logging
-import threading
 import time
 import sqlite3
-from datetime import datetime
-from db_models import Database
-from worker import LinkWorker
+from urllib.parse import urlparse
+from db_models import get_database
+from render_cache import RenderCache, RowCache
+from timestamps import DAY_SECONDS, to_datetime
+from logging_config import configure_logging
 from dotenv import load_dotenv
 load_dotenv()  # Load environment variables from .env file
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("link_system.log"),
-        logging.StreamHandler()
-    ]
-)
+# Configure logging (app is also imported directly by WSGI servers). Each WSGI worker process
+# rotates a log file of its own; under main.py logging is already configured and this does nothing
+configure_logging(log_file=f"link_system.web-{os.getpid()}.log")
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = 'ttz'
-db = Database()
-worker = LinkWorker()
+db = get_database()
+
+# Workers that have not reported within this many seconds are treated as stopped
+WORKER_STATUS_MAX_AGE = int(os.environ.get('WORKER_STATUS_MAX_AGE', 60))
+# Longest time a rendered status page is reused, since it shows how long ago workers reported
+STATUS_CACHE_SECONDS = float(os.environ.get('STATUS_CACHE_SECONDS', 5))
+# days_remaining is shown rounded to a tenth of a day
+DAYS_REMAINING_STEP = DAY_SECONDS / 10
 
 
 # Add datetime format filter
@@ -33,105 +34,111 @@ worker = LinkWorker()
 def format_datetime(value, format='%d %b %Y %H:%M'):
     if value:
         try:
-            # First remove microseconds if present
-            if '.' in value:
-                value = value.split('.')[0]
-                # Parse the datetime string and format it
-            dt = datetime.strptime(value, '%Y-%m-%d %H:%M:%S')
-            return dt.strftime(format)
+            return to_datetime(value).strftime(format)
         except Exception as e:
             logger.error(f"Error formatting datetime: {e}")
             return value
     return ''
 
 
-# Start background worker thread
-def background_worker():
-    while True:
-        try:
-            worker.process_pending_accesses()
-            time.sleep(60)  # Check every minute
-        except Exception as e:
-            logger.error(f"Error in background worker: {e}")
-            time.sleep(60)  # Wait a bit before retrying
+@app.template_filter('mask_proxy')
+def mask_proxy(value):
+    """Hide the credentials of a proxy URL"""
+    if not value:
+        return 'direct'
+    parsed = urlparse(value)
+    if parsed.password:
+        return value.replace(f"{parsed.username}:{parsed.password}@", f"{parsed.username}:***@", 1)
+    return value
+
+
+# Rendered pages, valid while the change counters the links triggers bump stay the same
+render_cache = RenderCache()
+# Display strings for each link's dates, formatted again only when the link changes
+link_display = RowCache(lambda link: {
+    'date_added_display': format_datetime(link['date_added']),
+    'cycle_start_display': format_datetime(link['current_cycle_start'])
+})
+
 
+def _links_version():
+    return tuple(sorted(db.get_change_counters().items()))
 
-# Create worker thread
-worker_thread = threading.Thread(target=background_worker, daemon=True)
+
+def _cached_page(name, version, render):
+    """Serve page name from the render cache, unless this request has flashed messages to show"""
+    if session.get('_flashes'):
+        # Flashed messages belong to this request only, so it gets its own copy of the page
+        return render()[0]
+    return render_cache.get_or_render(name, version, render)
 
 
 @app.route('/')
 def index():
     """Dashboard home page"""
+    return _cached_page('index', _links_version(), _render_index)
+
+
+def _render_index():
     active_links = db.get_active_links()
-    return render_template('index.html', links=active_links)
+    links = [dict(link, **display) for link, display in zip(active_links, link_display.get(active_links))]
+    # The page is valid until the first link's rounded days_remaining changes
+    now = time.time()
+    expires_at = now + 1 + min(((link['current_cycle_end'] - now - DAYS_REMAINING_STEP / 2) % DAYS_REMAINING_STEP
+                                for link in active_links), default=DAY_SECONDS)
+    return render_template('index.html', links=links), expires_at
 
 
 @app.route('/status')
 def worker_status():
-    """Show worker thread status"""
-    # Get current active tasks
+    """Show the status reported by the worker processes"""
+    # Workers publish every few seconds, so open tabs reloading the page share one render per report
+    version = (_links_version(), db.get_worker_status_version())
+    return _cached_page('status', version, _render_status)
+
+
+def _render_status():
+    workers = db.get_worker_statuses(WORKER_STATUS_MAX_AGE)
+
+    # Merge the active tasks of every worker process
     active_tasks = []
-    with worker.task_lock:
-        for task_id, future in worker.active_tasks.items():
-            active_tasks.append({
-                'id': task_id,
-                'status': 'Running' if not future.done() else 'Completed',
-                'start_time': getattr(future, 'start_time', 'Unknown')
-            })
-
-            # Get system stats
+    for worker in workers:
+        for task in worker['status'].get('tasks', []):
+            active_tasks.append(dict(task, worker=worker['worker_id']))
+
+    # Get system stats
     stats = {
-        'active_workers': len(worker.active_tasks),
-        'max_workers': worker.max_workers,
-        'proxies_loaded': len(worker.proxies),
+        'worker_processes': len(workers),
+        'active_workers': sum(w['status'].get('active_workers', 0) for w in workers),
+        'max_workers': sum(w['status'].get('max_workers', 0) for w in workers),
+        'concurrency_limit': sum(w['status'].get('concurrency', {}).get('limit', 0) for w in workers),
+        'proxies_loaded': max((w['status'].get('proxies_loaded', 0) for w in workers), default=0),
         'active_links': len(db.get_active_links())
     }
 
-    return render_template('status.html', tasks=active_tasks, stats=stats)
+    now = time.time()
+    return render_template('status.html', tasks=active_tasks, stats=stats, workers=workers,
+                           bandwidth=db.get_bandwidth_summary(24), now=now, now_ts=now), now + STATUS_CACHE_SECONDS
 
 @app.route('/add_link', methods=['POST'])
 def add_link():
-    """Add a new link and extract metadata immediately"""
+    """Queue a new link for the worker, which expands listings and extracts metadata"""
     try:
         url = request.form.get('url', '').strip()
         if not url:
             return jsonify({"error": "URL cannot be empty"}), 400
 
-            # Check if the URL contains a directory listing and extract direct links
-        links_to_add = worker.check_and_extract_links(url)
-
-        # Keep track of how many links were successfully added
-        added_count = 0
-        duplicate_count = 0
-
-        for link_url in links_to_add:
-            # Check if link already exists
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM links WHERE url = ?", (link_url,))
-            existing = cursor.fetchone()
-
-            if existing:
-                # Link already exists, skip it
-                duplicate_count += 1
-                logger.info(f"Skipping duplicate link: {link_url}")
-                continue
-
-                # Add link to database
-            link_id = db.add_link(link_url)
-            added_count += 1
-
-            # Extract metadata immediately in a non-blocking way
-            threading.Thread(target=worker.extract_metadata, args=(link_url, link_id)).start()
-
-            # Create appropriate flash message
-        if added_count > 0 and duplicate_count > 0:
-            flash(f"Added {added_count} new links. Skipped {duplicate_count} duplicate links.", "success")
-        elif added_count > 0:
-            flash(f"Added {added_count} new links successfully.", "success")
-        else:
-            flash(f"No new links added. All {duplicate_count} links already exist in the database.", "warning")
+        existing = db.get_link_by_url(url)
+        if existing and existing['deleted_at'] is not None:
+            flash("This link is still being deleted. Add it again once its history has been removed.", "warning")
+            return redirect(url_for('index'))
+        if existing:
+            flash("No new links added. This link already exists in the database.", "warning")
+            return redirect(url_for('index'))
+
+        # Directory listings are expanded by the worker, so scraping never runs in the web process
+        db.enqueue_command('add_url', {"url": url})
+        flash("Link queued. It will appear once a worker has imported it.", "success")
 
         return redirect(url_for('index'))
     except Exception as e:
@@ -141,7 +148,7 @@ def add_link():
 
 @app.route('/delete_link/<int:link_id>', methods=['POST'])
 def delete_link(link_id):
-    """Delete a link and its logs"""
+    """Mark a link deleted; a worker removes it and its logs in the background"""
     try:
         success = db.delete_link(link_id)
         if success:
@@ -155,23 +162,15 @@ def delete_link(link_id):
 
 @app.route('/force_run/<int:link_id>', methods=['POST'])
 def force_run(link_id):
-    """Force run the worker process for a specific link"""
+    """Ask a worker to run an access for a specific link"""
     try:
-        # Get the URL for this link ID
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT url FROM links WHERE id = ?", (link_id,))
-        result = cursor.fetchone()
-
-        if not result:
+        link = db.get_link(link_id)
+        if not link or link['deleted_at'] is not None:
             return jsonify({"error": "Link not found"}), 404
 
-        url = result['url']
-
-        # Run access in a separate thread
-        threading.Thread(target=worker.access_link, args=(link_id, url)).start()
+        db.enqueue_command('force_run', {"link_id": link_id})
 
-        return jsonify({"success": True, "message": "Access process started"})
+        return jsonify({"success": True, "message": "Access process queued"})
     except Exception as e:
         logger.error(f"Error in force run for link {link_id}: {e}")
         return jsonify({"error": str(e)}), 500
@@ -182,14 +181,56 @@ def get_links():
     """API endpoint to get active links"""
     try:
         active_links = db.get_active_links()
-        # Convert Row objects to dictionaries
-        links_data = [dict(link) for link in active_links]
+        # Convert Row objects to dictionaries, keeping dates in their readable form for API clients
+        links_data = []
+        for link in active_links:
+            link_data = dict(link)
+            for column in ('date_added', 'current_cycle_start', 'current_cycle_end'):
+                link_data[column] = str(to_datetime(link_data[column]))
+            links_data.append(link_data)
         return jsonify({"links": links_data})
     except Exception as e:
         logger.error(f"Error getting links: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/api/capacity')
+def capacity_forecast():
+    """
+    Forecast accesses per hour or day for the next days, with the concurrency needed at the peak and
+    the proxy count the 24 hour cooldown requires. Query parameters: days (default 30), bucket
+    (hour or day) and latency (seconds per access, default the slowest worker's observed p95).
+    """
+    # Imported here so web processes only load numpy once the forecast is requested
+    import capacity
+
+    try:
+        workers = db.get_worker_statuses(WORKER_STATUS_MAX_AGE)
+        latency = request.args.get('latency', type=float)
+        latency_source = 'request'
+        if latency is None:
+            observed = [w['status'].get('concurrency', {}).get('p95_latency') for w in workers]
+            observed = [value for value in observed if value is not None]
+            if observed:
+                latency, latency_source = max(observed), 'observed p95'
+            else:
+                latency = float(os.environ.get('ACCESS_LATENCY_TARGET_SECONDS', 20))
+                latency_source = 'latency target'
+
+        result = capacity.forecast(db.get_link_states(0), time.time(),
+                                   days=request.args.get('days', 30, type=float),
+                                   bucket=request.args.get('bucket', 'hour'),
+                                   latency=latency)
+        result['latency_source'] = latency_source
+        result['proxies_loaded'] = max((w['status'].get('proxies_loaded', 0) for w in workers), default=0)
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error forecasting capacity: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/query', methods=['GET', 'POST'])
 def query():
     """Page for executing raw SQL queries"""
@@ -212,8 +253,5 @@ def query():
 
 
 if __name__ == '__main__':
-    # Start the background worker in a separate thread
-    worker_thread.start()
-
-    # Run the Flask application  
+    # Run the Flask application (start workers separately with `python main.py worker`)
     app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), debug=False)
\ No newline at end of file
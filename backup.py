@@ -0,0 +1,291 @@
+# backup.py
+"""
+Online backups of the SQLite database.
+
+Snapshots are copied with sqlite3.Connection.backup on a dedicated connection, a limited number
+of pages per step with a pause in between. The database runs in WAL mode (see db_models._connect),
+so the copy only holds a read snapshot and worker commits keep going while a large database is copied,
+even through the single final step taken when steady writes keep restarting it.
+
+With STORAGE_SHARDS set, the shard files are copied along with the main database into one snapshot
+set: links-20250101-120000.db goes with links.shard0-20250101-120000.db and so on. The main file is
+renamed into place last, so a snapshot that shows up in snapshots() always has its shards.
+"""
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from db_models import shard_path
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIXES = ('.db', '.db.gz')
+# Name of the job claim that lets one process at a time take a backup (see Database.claim_job)
+BACKUP_JOB = 'backup'
+# Seconds a backup claim lasts if its holder dies without releasing it
+BACKUP_CLAIM_TTL = 6 * 3600
+
+
+class _BackupRestarted(Exception):
+    """Another connection wrote to the source database, so SQLite started the copy over"""
+
+
+def create_backup_manager(db_name):
+    """Build a BackupManager for db_name and its STORAGE_SHARDS files from the BACKUP_* environment variables"""
+    shard_count = int(os.environ.get('STORAGE_SHARDS', 1))
+    return BackupManager(
+        db_name,
+        shard_names=[shard_path(db_name, index) for index in range(shard_count)] if shard_count > 1 else (),
+        backup_dir=os.environ.get('BACKUP_DIR', 'backups'),
+        keep=int(os.environ.get('BACKUP_KEEP', 7)),
+        compress=os.environ.get('BACKUP_COMPRESS', '1') not in ('0', 'false', 'False'),
+        interval_hours=float(os.environ.get('BACKUP_INTERVAL_HOURS', 0)),
+        pages_per_step=int(os.environ.get('BACKUP_PAGES_PER_STEP', 256)),
+        step_pause=float(os.environ.get('BACKUP_STEP_PAUSE_SECONDS', 0.05))
+    )
+
+
+class BackupManager:
+    """
+    Takes, prunes and restores snapshots of a database file and its shard_names files.
+    With interval_hours set, is_due() tells the caller when the newest snapshot is old enough to take
+    another one; keep is the number of snapshots retained. Access latencies observed while a backup runs
+    are collected so its effect on the worker can be reported next to its duration.
+    """
+
+    def __init__(self, db_name, backup_dir='backups', keep=7, compress=True, interval_hours=0,
+                 pages_per_step=256, step_pause=0.05, max_restarts=4, shard_names=()):
+        if keep < 1:
+            raise ValueError(f"BACKUP_KEEP must be at least 1, not {keep}")
+        self.db_name = db_name
+        self.shard_names = list(shard_names)
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.compress = compress
+        self.interval = interval_hours * 3600
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.max_restarts = max_restarts
+        self.running = False
+        self.last_backup = None
+        self.last_error = None
+        self._latencies = []
+        self._lock = threading.Lock()
+
+    def _prefix(self, db_name=None):
+        return os.path.splitext(os.path.basename(db_name or self.db_name))[0] + '-'
+
+    def _snapshot_set(self, snapshot):
+        """(database file, snapshot file) for the main database and every shard of a snapshot"""
+        stamp = os.path.basename(snapshot)[len(self._prefix()):]
+        directory = os.path.dirname(snapshot)
+        return [(self.db_name, snapshot)] + [(name, os.path.join(directory, self._prefix(name) + stamp))
+                                             for name in self.shard_names]
+
+    def snapshots(self):
+        """Paths of the existing snapshots, newest first"""
+        pattern = os.path.join(self.backup_dir, f"{self._prefix()}*")
+        # Snapshot names carry their timestamp, so name order is age order
+        return sorted((path for path in glob.glob(pattern) if path.endswith(SNAPSHOT_SUFFIXES)), reverse=True)
+
+    def is_due(self):
+        """Check whether scheduled backups are on and the newest snapshot is older than the interval"""
+        if not self.interval or self.running:
+            return False
+        snapshots = self.snapshots()
+        return not snapshots or time.time() - os.path.getmtime(snapshots[0]) >= self.interval
+
+    def observe_latency(self, latency):
+        """Record the latency of an access that finished, kept only while a backup is running"""
+        if self.running:
+            with self._lock:
+                self._latencies.append(latency)
+
+    def run(self, baseline_latency=None):
+        """
+        Take a snapshot now and prune old ones. baseline_latency is the access p95 before the backup,
+        reported next to the p95 of the accesses that finished while it ran. Returns the backup's stats.
+        """
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A backup is already running")
+            self.running = True
+            self._latencies = []
+
+        os.makedirs(self.backup_dir, exist_ok=True)
+        path = os.path.join(self.backup_dir, f"{self._prefix()}{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+        suffix = '.gz' if self.compress else ''
+        snapshot_set = self._snapshot_set(path + suffix)
+        # The process id keeps temporary files apart if another process backs up at the same second
+        partials = [f"{target}.{os.getpid()}.partial" for _, target in snapshot_set]
+        started = time.monotonic()
+
+        try:
+            logger.info(f"Starting backup of {self.db_name} to {path}"
+                        + (f" with {len(self.shard_names)} shards" if self.shard_names else ""))
+            steps = restarts = 0
+            for (source, _), partial in zip(snapshot_set, partials):
+                copy_steps, copy_restarts = self._copy(source, partial)
+                steps += copy_steps
+                restarts += copy_restarts
+            copy_seconds = time.monotonic() - started
+
+            if self.compress:
+                for partial in partials:
+                    with open(partial, 'rb') as uncompressed, gzip.open(partial + '.gz', 'wb') as compressed:
+                        shutil.copyfileobj(uncompressed, compressed)
+                    os.remove(partial)
+                partials = [partial + '.gz' for partial in partials]
+                path += suffix
+            # The main snapshot goes last: once it exists, so do its shards
+            for (_, target), partial in reversed(list(zip(snapshot_set, partials))):
+                os.replace(partial, target)
+
+            with self._lock:
+                latencies = sorted(self._latencies)
+            stats = {
+                'file': os.path.basename(path),
+                'finished_at': time.time(),
+                'duration': round(time.monotonic() - started, 2),
+                'copy_seconds': round(copy_seconds, 2),
+                'steps': steps,
+                'restarts': restarts,
+                'db_size': sum(os.path.getsize(source) for source, _ in snapshot_set),
+                'size': sum(os.path.getsize(target) for _, target in snapshot_set),
+                'compressed': self.compress,
+                'accesses_during': len(latencies),
+                'p95_latency_before': round(baseline_latency, 2) if baseline_latency is not None else None,
+                'p95_latency_during': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2)
+                if latencies else None
+            }
+            self.last_backup = stats
+            self.last_error = None
+            logger.info(f"Backup {stats['file']} finished in {stats['duration']}s ({stats['steps']} steps, "
+                        f"{stats['restarts']} restarts, {stats['size']} bytes)")
+            self._prune()
+            return stats
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Backup of {self.db_name} failed: {e}")
+            leftovers = [target for _, target in snapshot_set]
+            leftovers += [leftover for partial in partials for leftover in (partial, partial + '.gz')]
+            for leftover in leftovers:
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+        finally:
+            self.running = False
+
+    def _copy(self, db_name, path):
+        """
+        Copy the database db_name to path in steps of pages_per_step pages. A write from another connection makes
+        SQLite restart the copy, so under steady writes each restart doubles the step size, and after
+        max_restarts the rest is copied in a single step, which in WAL mode doesn't block writers.
+        Returns the number of steps and restarts.
+        """
+        steps = 0
+        for restarts in range(self.max_restarts + 1):
+            pages = self.pages_per_step * 2 ** restarts if restarts < self.max_restarts else -1
+            remaining_before = None
+
+            def progress(status, remaining, total):
+                nonlocal steps, remaining_before
+                steps += 1
+                if remaining_before is not None and remaining > remaining_before:
+                    raise _BackupRestarted()
+                remaining_before = remaining
+                # Let writers at the database between steps
+                time.sleep(self.step_pause)
+
+            source = sqlite3.connect(db_name)
+            target = sqlite3.connect(path)
+            try:
+                source.backup(target, pages=pages, progress=progress)
+                return steps, restarts
+            except _BackupRestarted:
+                logger.info(f"Backup of {db_name} restarted by a concurrent write, retrying with "
+                            f"{'all' if restarts + 1 == self.max_restarts else pages * 2} pages per step")
+            finally:
+                target.close()
+                source.close()
+
+    def _prune(self):
+        """Delete all but the newest keep snapshots, with their shards"""
+        for path in self.snapshots()[self.keep:]:
+            # Shards first, so a half-pruned set never looks like a complete snapshot
+            for _, target in reversed(self._snapshot_set(path)):
+                if os.path.exists(target):
+                    os.remove(target)
+            logger.info(f"Removed old backup {path}")
+
+    def restore(self, snapshot=None):
+        """
+        Replace the contents of the database and its shards with a snapshot set, the newest one by default.
+        Stop the workers first: the copy takes the database's write lock for its whole duration.
+        """
+        if snapshot is None:
+            snapshots = self.snapshots()
+            if not snapshots:
+                raise FileNotFoundError(f"No backups of {self.db_name} found in {self.backup_dir}")
+            snapshot = snapshots[0]
+
+        snapshot_set = self._snapshot_set(snapshot)
+        missing = [target for _, target in snapshot_set if not os.path.exists(target)]
+        if missing:
+            raise FileNotFoundError(f"Backup {snapshot} is incomplete, missing {', '.join(missing)}")
+
+        # Check every file of the set before touching any database, so a bad shard can't leave a mix
+        source_paths = []
+        try:
+            for db_name, target in snapshot_set:
+                source_path = target
+                if target.endswith('.gz'):
+                    source_path = os.path.join(self.backup_dir, f"{self._prefix(db_name)}restore.{os.getpid()}.partial")
+                    with gzip.open(target, 'rb') as compressed, open(source_path, 'wb') as uncompressed:
+                        shutil.copyfileobj(compressed, uncompressed)
+                source_paths.append(source_path)
+
+                source = sqlite3.connect(source_path)
+                try:
+                    check = source.execute("PRAGMA integrity_check").fetchone()[0]
+                finally:
+                    source.close()
+                if check != 'ok':
+                    raise ValueError(f"Backup {target} failed its integrity check: {check}")
+
+            for (db_name, _), source_path in zip(snapshot_set, source_paths):
+                source = sqlite3.connect(source_path)
+                try:
+                    target = sqlite3.connect(db_name)
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+                finally:
+                    source.close()
+        finally:
+            for (_, target), source_path in zip(snapshot_set, source_paths):
+                if source_path != target:
+                    os.remove(source_path)
+
+        logger.info(f"Restored {self.db_name} from {snapshot}")
+        return snapshot
+
+    def get_status(self):
+        """Backup state for the status page, or None if backups are off and none was taken"""
+        if not self.interval and self.last_backup is None and self.last_error is None:
+            return None
+        return {
+            'running': self.running,
+            'interval_hours': round(self.interval / 3600, 2),
+            'keep': self.keep,
+            'snapshots': len(self.snapshots()),
+            'last': self.last_backup,
+            'error': self.last_error
+        }
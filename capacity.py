@@ -0,0 +1,150 @@
+# capacity.py
+"""
+Capacity planning for the access schedule.
+
+Projects every active link's remaining accesses on the x**3 curve, including the cycles that start
+after the current one ends, into hourly or daily buckets. From the projection it derives the
+concurrency needed at the peak (Little's law: arrival rate times access latency) and the smallest
+proxy list that lets every link respect the 24 hour per-link proxy cooldown.
+
+numpy is used when it is installed; otherwise an equivalent pure Python version runs.
+"""
+import bisect
+import math
+
+from link_state import VIEWS_PER_CYCLE, access_offset
+from timestamps import CYCLE_SECONDS, DAY_SECONDS, to_epoch
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BUCKET_SECONDS = {'hour': 3600, 'day': DAY_SECONDS}
+COOLDOWN_SECONDS = 24 * 3600
+MAX_DAYS = 365
+# Links evaluated per numpy batch, bounding memory to a few MB per schedule matrix
+CHUNK_SIZE = 8192
+
+
+def _cycles_in_horizon(cycle_end, horizon_end):
+    """Number of cycles after the current one that start before horizon_end"""
+    return max(0, math.ceil((horizon_end - cycle_end) / CYCLE_SECONDS))
+
+
+def _forecast_numpy(links, now, horizon_end, bucket_seconds, bucket_count):
+    counts = np.zeros(bucket_count, dtype=np.int64)
+    max_window = 0
+    overdue = 0
+    curve = (np.arange(VIEWS_PER_CYCLE) / (VIEWS_PER_CYCLE - 1)) ** 3
+    views = np.arange(VIEWS_PER_CYCLE)
+    # Row stride for searching every link's schedule at once in one flattened, sorted array
+    stride = horizon_end - now + COOLDOWN_SECONDS + 1
+
+    for offset in range(0, len(links), CHUNK_SIZE):
+        chunk = np.array(links[offset:offset + CHUNK_SIZE], dtype=np.float64)
+        starts, ends, done = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+
+        # Remaining accesses of the current cycle. A cycle that already ended is rolled over
+        # without its missing views, like Database.advance_cycles does
+        current = starts[:, None] + curve[None, :] * (ends - starts)[:, None]
+        current[views[None, :] < done[:, None]] = np.inf
+        current[ends <= now] = np.inf
+        schedules = [current]
+
+        # Whole cycles that start after the current one, before the horizon ends
+        for cycle in range(_cycles_in_horizon(ends.min(), horizon_end)):
+            cycle_starts = ends + cycle * CYCLE_SECONDS
+            schedules.append(cycle_starts[:, None] + curve[None, :] * CYCLE_SECONDS)
+
+        # Overdue accesses are counted apart: catch-up spreads them out instead of following the curve
+        times = np.concatenate(schedules, axis=1)
+        late = times < now
+        overdue += int(late.sum())
+        times[late | (times >= horizon_end)] = np.inf
+        times.sort(axis=1)
+        scheduled = np.isfinite(times)
+
+        # Accesses per bucket
+        buckets = ((times[scheduled] - now) // bucket_seconds).astype(np.int64)
+        counts += np.bincount(buckets, minlength=bucket_count)[:bucket_count]
+
+        # Most accesses any link makes within one cooldown window: rows are sorted, so offset
+        # each row by its own stride and search every window end in a single call
+        rows, width = times.shape
+        relative = np.where(scheduled, times - now, stride - 1)
+        flat = (relative + np.arange(rows)[:, None] * stride).ravel()
+        window_ends = np.searchsorted(flat, flat + COOLDOWN_SECONDS, side='left')
+        in_window = (window_ends - np.arange(flat.size)).reshape(rows, width)
+        in_window[~scheduled] = 0
+        if in_window.size:
+            max_window = max(max_window, int(in_window.max()))
+
+    return counts.tolist(), max_window, overdue
+
+
+def _forecast_python(links, now, horizon_end, bucket_seconds, bucket_count):
+    counts = [0] * bucket_count
+    max_window = 0
+    overdue = 0
+    curve = [access_offset(view, 1) for view in range(VIEWS_PER_CYCLE)]
+
+    for start, end, done in links:
+        times = [start + fraction * (end - start) for fraction in curve[int(done):]] if end > now else []
+        for cycle in range(_cycles_in_horizon(end, horizon_end)):
+            cycle_start = end + cycle * CYCLE_SECONDS
+            times.extend(cycle_start + fraction * CYCLE_SECONDS for fraction in curve)
+        overdue += sum(1 for at in times if at < now)
+        times = [at for at in times if now <= at < horizon_end]
+
+        for index, at in enumerate(times):
+            counts[int((at - now) // bucket_seconds)] += 1
+            max_window = max(max_window, bisect.bisect_left(times, at + COOLDOWN_SECONDS) - index)
+
+    return counts, max_window, overdue
+
+
+def forecast(link_states, now, days=30, bucket='hour', latency=None):
+    """
+    Forecast the accesses of the links in link_states (rows as returned by Database.get_link_states)
+    over the next days, in hour or day buckets. latency is the access duration in seconds used to turn
+    the peak rate into the number of accesses in flight at once. Accesses that are already overdue are
+    reported as overdue_accesses rather than in the buckets.
+    """
+    if bucket not in BUCKET_SECONDS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKET_SECONDS)}, not {bucket}")
+    if not 0 < days <= MAX_DAYS:
+        raise ValueError(f"days must be between 0 and {MAX_DAYS}")
+
+    bucket_seconds = BUCKET_SECONDS[bucket]
+    bucket_count = math.ceil(days * DAY_SECONDS / bucket_seconds)
+    horizon_end = now + bucket_count * bucket_seconds
+    links = [(to_epoch(start), to_epoch(end), views)
+             for _, start, end, views, _, active, _ in link_states if active]
+
+    engine = 'numpy' if np is not None else 'python'
+    run = _forecast_numpy if np is not None else _forecast_python
+    counts, max_window, overdue = run(links, now, horizon_end, bucket_seconds, bucket_count)
+
+    peak_index = max(range(bucket_count), key=counts.__getitem__)
+    peak_rate = counts[peak_index] / bucket_seconds
+    return {
+        'links': len(links),
+        'days': days,
+        'bucket': bucket,
+        'engine': engine,
+        'start': now,
+        'total_accesses': sum(counts),
+        'overdue_accesses': overdue,
+        'buckets': [{'start': now + index * bucket_seconds, 'accesses': count}
+                    for index, count in enumerate(counts)],
+        'peak': {
+            'start': now + peak_index * bucket_seconds,
+            'accesses': counts[peak_index],
+            'per_hour': round(peak_rate * 3600, 1)
+        },
+        'latency_seconds': latency,
+        # Little's law: accesses in flight = arrival rate x time each access takes
+        'peak_concurrency': math.ceil(peak_rate * latency) if latency else None,
+        'min_proxies': max_window
+    }
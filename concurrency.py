@@ -0,0 +1,97 @@
+# concurrency.py
+import logging
+import time
+from collections import deque
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyController:
+    """
+    AIMD limit on the number of in-flight accesses.
+    The limit grows additively while there is a backlog the current limit can't absorb, and shrinks
+    multiplicatively when the error rate or p95 latency goes over target. It always stays between floor and ceiling.
+    """
+
+    def __init__(self, floor, ceiling, latency_target, error_threshold=0.2, increase_step=2,
+                 decrease_factor=0.5, window=200, min_samples=10):
+        if floor < 1 or ceiling < floor:
+            raise ValueError(f"Invalid concurrency bounds: floor={floor}, ceiling={ceiling}")
+        self.floor = floor
+        self.ceiling = ceiling
+        self.latency_target = latency_target
+        self.error_threshold = error_threshold
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.min_samples = min_samples
+        self.limit = floor
+        self.reason = "initial limit"
+        self.changed_at = time.time()
+        self._samples = deque(maxlen=window)
+        self._lock = Lock()
+
+    def record(self, latency, success):
+        """Record the outcome of one access"""
+        with self._lock:
+            self._samples.append((latency, success))
+
+    def p95_latency(self):
+        with self._lock:
+            latencies = sorted(latency for latency, _ in self._samples)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def error_rate(self):
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return None
+        return sum(1 for _, success in samples if not success) / len(samples)
+
+    def adjust(self, backlog, in_flight):
+        """Update the limit from the current due-queue depth and in-flight count, returning the new limit"""
+        with self._lock:
+            enough_samples = len(self._samples) >= self.min_samples
+        error_rate = self.error_rate()
+        p95 = self.p95_latency()
+
+        if enough_samples and error_rate > self.error_threshold:
+            self._decrease(f"error rate {error_rate:.0%} above {self.error_threshold:.0%}")
+        elif enough_samples and p95 > self.latency_target:
+            self._decrease(f"p95 latency {p95:.1f}s above {self.latency_target:.1f}s target")
+        elif backlog > 0 and in_flight >= self.limit:
+            self._set(self.limit + self.increase_step, f"{backlog} due accesses waiting for a slot")
+        elif backlog == 0 and in_flight < self.limit // 2:
+            self._set(self.limit - 1, f"idle, {in_flight} of {self.limit} slots in use")
+        return self.limit
+
+    def _decrease(self, reason):
+        new_limit = int(self.limit * self.decrease_factor)
+        if new_limit < self.limit:
+            # Drop the samples that caused the decrease so the next adjustment sees fresh data
+            with self._lock:
+                self._samples.clear()
+        self._set(new_limit, reason)
+
+    def _set(self, new_limit, reason):
+        new_limit = max(self.floor, min(self.ceiling, new_limit))
+        if new_limit != self.limit:
+            logger.info(f"Concurrency limit {self.limit} -> {new_limit}: {reason}")
+            self.limit = new_limit
+            self.reason = reason
+            self.changed_at = time.time()
+
+    def get_status(self):
+        p95 = self.p95_latency()
+        error_rate = self.error_rate()
+        return {
+            'limit': self.limit,
+            'floor': self.floor,
+            'ceiling': self.ceiling,
+            'reason': self.reason,
+            'changed_at': self.changed_at,
+            'p95_latency': round(p95, 2) if p95 is not None else None,
+            'error_rate': round(error_rate, 3) if error_rate is not None else None
+        }
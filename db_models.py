@@ -1,198 +1,778 @@
 # db_models.py  
 import sqlite3
 import os
+import random
+import time
+import zlib
+import json
 import logging
-from datetime import datetime, timedelta
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("link_system.log"),
-        logging.StreamHandler()
-    ]
-)
+import threading
+import functools
+from timestamps import current_time, now_ts, CYCLE_SECONDS
+from logging_config import get_access_logger
+
 logger = logging.getLogger(__name__)
+# Messages logged on every access, sampled by logging_config
+access_logger = get_access_logger(__name__)
+
+# Seconds a connection waits for another connection's write lock before giving up
+BUSY_TIMEOUT_SECONDS = 30
+# Owner of the lease of a view slot that gave up, which no worker may claim until it expires
+COOLDOWN_OWNER = 'cooldown'
+
+
+def shard_for(link_id, shard_count):
+    """Return the shard index a link belongs to when splitting work by link id"""
+    if shard_count <= 1:
+        return 0
+    return zlib.crc32(str(link_id).encode()) % shard_count
+
+
+def _connect(db_name):
+    """
+    Open a database connection in WAL mode: readers, such as an online backup copying the file, then
+    don't block commits, and a writer waits up to BUSY_TIMEOUT_SECONDS for another writer's lock
+    """
+    conn = sqlite3.connect(db_name, check_same_thread=False, timeout=BUSY_TIMEOUT_SECONDS)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def _synchronized(method):
+    """Serialize use of the shared connection so one thread's commit or rollback can't end another's transaction"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def _migration_1_baseline(cursor):
+    """
+    Bring a database created before schema versioning up to the baseline schema.
+    Older databases may be in any of several legacy shapes, so every step checks what exists first.
+    """
+    # Create links table with new columns for cycle tracking
+    cursor.execute('''  
+    CREATE TABLE IF NOT EXISTS links (  
+        id INTEGER PRIMARY KEY AUTOINCREMENT,  
+        url TEXT UNIQUE NOT NULL,  
+        date_added TIMESTAMP NOT NULL,  
+        current_cycle_start TIMESTAMP NOT NULL,  
+        current_cycle_end TIMESTAMP NOT NULL,  
+        total_views INTEGER DEFAULT 0,  
+        current_period_views INTEGER DEFAULT 0,  
+        current_cycle INTEGER DEFAULT 1,  
+        active BOOLEAN DEFAULT 1,  
+        filename TEXT,  
+        file_details TEXT  
+    )  
+    ''')
+
+    # Check if we need to update the schema for existing tables
+    cursor.execute("PRAGMA table_info(links)")
+    columns = [column[1] for column in cursor.fetchall()]
+
+    # Add new columns if they don't exist (existing code)
+    if "filename" not in columns:
+        cursor.execute("ALTER TABLE links ADD COLUMN filename TEXT")
+        logger.info("Added filename column to links table")
+
+    if "file_details" not in columns:
+        cursor.execute("ALTER TABLE links ADD COLUMN file_details TEXT")
+        logger.info("Added file_details column to links table")
+
+    if "current_cycle" not in columns:
+        cursor.execute("ALTER TABLE links ADD COLUMN current_cycle INTEGER DEFAULT 1")
+        logger.info("Added current_cycle column to links table")
+
+    if "current_cycle_start" not in columns:
+        cursor.execute("ALTER TABLE links ADD COLUMN current_cycle_start TIMESTAMP")
+        # Update existing records
+        cursor.execute("UPDATE links SET current_cycle_start = date_added WHERE current_cycle_start IS NULL")
+        logger.info("Added current_cycle_start column to links table")
+
+    if "current_cycle_end" not in columns:
+        cursor.execute("ALTER TABLE links ADD COLUMN current_cycle_end TIMESTAMP")
+        # Update existing records
+        cursor.execute(
+            "UPDATE links SET current_cycle_end = datetime(date_added, '+60 days') WHERE current_cycle_end IS NULL")
+        logger.info("Added current_cycle_end column to links table")
+
+        # End of existing column checks
+
+    # Create access logs table
+    cursor.execute('''  
+    CREATE TABLE IF NOT EXISTS access_logs (  
+        id INTEGER PRIMARY KEY AUTOINCREMENT,  
+        link_id INTEGER NOT NULL,  
+        access_time TIMESTAMP NOT NULL,  
+        proxy_used TEXT,  
+        status_code INTEGER,  
+        error_message TEXT,  
+        cycle INTEGER NOT NULL DEFAULT 1,  
+        FOREIGN KEY (link_id) REFERENCES links (id)  
+    )  
+    ''')
+
+    # Add cycle column to access_logs if it doesn't exist
+    cursor.execute("PRAGMA table_info(access_logs)")
+    columns = [column[1] for column in cursor.fetchall()]
+    if "cycle" not in columns:
+        cursor.execute("ALTER TABLE access_logs ADD COLUMN cycle INTEGER NOT NULL DEFAULT 1")
+        logger.info("Added cycle column to access_logs table")
+
+    if "failure_kind" not in columns:
+        cursor.execute("ALTER TABLE access_logs ADD COLUMN failure_kind TEXT")
+        logger.info("Added failure_kind column to access_logs table")
+
+        # Check if proxy_usage table exists
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='proxy_usage'")
+    proxy_usage_exists = cursor.fetchone() is not None
+
+    if not proxy_usage_exists:
+        # Create proxy usage table with updated schema to include per-link cooldown tracking
+        cursor.execute('''  
+        CREATE TABLE IF NOT EXISTS proxy_usage (  
+            id INTEGER PRIMARY KEY AUTOINCREMENT,  
+            link_id INTEGER NOT NULL,  
+            proxy TEXT NOT NULL,  
+            cycle INTEGER NOT NULL,  
+            used_at TIMESTAMP NOT NULL,  
+            FOREIGN KEY (link_id) REFERENCES links (id),  
+            UNIQUE(link_id, proxy, cycle)  
+        )  
+        ''')
+        logger.info("Created proxy_usage table")
+    else:
+        # Check if the proxy_usage table has the required columns
+        cursor.execute("PRAGMA table_info(proxy_usage)")
+        columns = [column[1] for column in cursor.fetchall()]
+
+        if "used_at" not in columns:
+            # Since SQLite doesn't support adding constraints to existing columns,
+            # we need to recreate the table if it's missing the timestamp field
+            # Temporarily rename the old table
+            cursor.execute("ALTER TABLE proxy_usage RENAME TO proxy_usage_old")
+
+            # Create the new table with the proper structure
+            cursor.execute('''  
+            CREATE TABLE proxy_usage (  
+                id INTEGER PRIMARY KEY AUTOINCREMENT,  
+                link_id INTEGER NOT NULL,  
+                proxy TEXT NOT NULL,  
+                cycle INTEGER NOT NULL,  
+                used_at TIMESTAMP NOT NULL,  
+                FOREIGN KEY (link_id) REFERENCES links (id),  
+                UNIQUE(link_id, proxy, cycle)  
+            )  
+            ''')
 
+            # Copy data from old table with a default timestamp for existing records
+            cursor.execute('''  
+            INSERT INTO proxy_usage(link_id, proxy, cycle, used_at)  
+            SELECT link_id, proxy, cycle, datetime('now', '-25 hours')   
+            FROM proxy_usage_old  
+            ''')
 
-class Database:
-    def __init__(self, db_name="links.db"):
+            # Drop the old table
+            cursor.execute("DROP TABLE proxy_usage_old")
+            logger.info("Updated proxy_usage table with used_at timestamp column")
+
+            # Create indexes for better performance
+    cursor.execute('''  
+    CREATE INDEX IF NOT EXISTS idx_proxy_usage_link_id_used_at   
+    ON proxy_usage (link_id, used_at)  
+    ''')
+
+    cursor.execute('''  
+    CREATE INDEX IF NOT EXISTS idx_links_active   
+    ON links (active)  
+    ''')
+
+    cursor.execute('''  
+    CREATE INDEX IF NOT EXISTS idx_access_logs_link_id   
+    ON access_logs (link_id)  
+    ''')
+
+    # Create access leases table used to claim due accesses across worker processes
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS access_leases (
+        link_id INTEGER NOT NULL,
+        view_index INTEGER NOT NULL,
+        owner TEXT NOT NULL,
+        claimed_at REAL NOT NULL,
+        expires_at REAL NOT NULL,
+        PRIMARY KEY (link_id, view_index)
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_access_leases_expires_at
+    ON access_leases (expires_at)
+    ''')
+
+    # Create command queue used by the web process to ask workers for work
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS worker_commands (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        command TEXT NOT NULL,
+        payload TEXT,
+        created_at REAL NOT NULL,
+        claimed_by TEXT,
+        claimed_at REAL,
+        completed_at REAL,
+        error TEXT
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS idx_worker_commands_pending
+    ON worker_commands (completed_at, id)
+    ''')
+
+    # Create worker status table so the dashboard can show workers running in other processes
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS worker_status (
+        worker_id TEXT PRIMARY KEY,
+        hostname TEXT,
+        pid INTEGER,
+        started_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        status TEXT
+    )
+    ''')
+
+
+def _migration_2_access_bytes(cursor):
+    """Record the bytes each access transferred"""
+    cursor.execute("ALTER TABLE access_logs ADD COLUMN bytes_in INTEGER")
+    cursor.execute("ALTER TABLE access_logs ADD COLUMN bytes_out INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_access_logs_access_time ON access_logs (access_time)")
+
+
+def _migration_3_link_change_tracking(cursor):
+    """
+    Track changes to links so in-memory copies can refresh only what changed.
+    Every insert or scheduling-relevant update stamps the row with the next value of the
+    'links' counter; deletes bump 'links_deleted' so readers know to reload everything.
+    """
+    cursor.execute("ALTER TABLE links ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_links_change_seq ON links (change_seq)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS change_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO change_counters (name, value) VALUES ('links', 0), ('links_deleted', 0)")
+
+    stamp = """
+        UPDATE change_counters SET value = value + 1 WHERE name = 'links';
+        UPDATE links SET change_seq = (SELECT value FROM change_counters WHERE name = 'links') WHERE id = NEW.id;
+    """
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS links_changed_insert AFTER INSERT ON links BEGIN {stamp} END")
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS links_changed_update
+    AFTER UPDATE OF current_cycle_start, current_cycle_end, current_period_views, current_cycle, active,
+                    filename, file_details
+    ON links BEGIN {stamp} END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS links_changed_delete AFTER DELETE ON links BEGIN
+        UPDATE change_counters SET value = value + 1 WHERE name = 'links_deleted';
+    END
+    """)
+
+
+def _migration_4_epoch_timestamps(cursor):
+    """
+    Store timestamps as integer epoch seconds instead of stringified datetimes.
+    Text written from datetime.now() is local time with microseconds; proxy_usage rows written
+    with SQLite's datetime('now') are UTC without them, so the two are converted separately.
+    """
+    local_to_epoch = "CAST(strftime('%s', {0}, 'utc') AS INTEGER)"
+    utc_to_epoch = "CAST(strftime('%s', {0}) AS INTEGER)"
+
+    for table, columns in (('links', ('date_added', 'current_cycle_start', 'current_cycle_end')),
+                           ('access_logs', ('access_time',))):
+        for column in columns:
+            cursor.execute(f"UPDATE {table} SET {column} = {local_to_epoch.format(column)} "
+                           f"WHERE typeof({column}) = 'text'")
+
+    cursor.execute(f"""
+    UPDATE proxy_usage
+    SET used_at = CASE WHEN instr(used_at, '.') > 0 THEN {local_to_epoch.format('used_at')}
+                       ELSE {utc_to_epoch.format('used_at')} END
+    WHERE typeof(used_at) = 'text'
+    """)
+
+
+def _migration_5_dictionary_tables(cursor):
+    """
+    Store each distinct proxy URL and error message once, in the proxies and error_kinds tables,
+    and refer to them by integer id from the log tables. The log tables move to access_log_entries
+    and proxy_usage_entries; access_logs and proxy_usage become views with the old columns.
+    """
+    cursor.execute("CREATE TABLE IF NOT EXISTS proxies (id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE)")
+    cursor.execute("CREATE TABLE IF NOT EXISTS error_kinds (id INTEGER PRIMARY KEY, message TEXT NOT NULL UNIQUE)")
+    cursor.execute("""
+    INSERT OR IGNORE INTO proxies (url)
+    SELECT proxy_used FROM access_logs WHERE proxy_used IS NOT NULL
+    UNION SELECT proxy FROM proxy_usage
+    """)
+    cursor.execute("""
+    INSERT OR IGNORE INTO error_kinds (message)
+    SELECT DISTINCT error_message FROM access_logs WHERE error_message IS NOT NULL
+    """)
+
+    cursor.execute("""
+    CREATE TABLE access_log_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        link_id INTEGER NOT NULL,
+        access_time INTEGER NOT NULL,
+        proxy_id INTEGER REFERENCES proxies (id),
+        status_code INTEGER,
+        error_kind_id INTEGER REFERENCES error_kinds (id),
+        cycle INTEGER NOT NULL DEFAULT 1,
+        failure_kind TEXT,
+        bytes_in INTEGER,
+        bytes_out INTEGER,
+        FOREIGN KEY (link_id) REFERENCES links (id)
+    )
+    """)
+    cursor.execute("""
+    INSERT INTO access_log_entries (id, link_id, access_time, proxy_id, status_code, error_kind_id, cycle,
+                                    failure_kind, bytes_in, bytes_out)
+    SELECT a.id, a.link_id, a.access_time, p.id, a.status_code, e.id, a.cycle, a.failure_kind, a.bytes_in, a.bytes_out
+    FROM access_logs a
+    LEFT JOIN proxies p ON p.url = a.proxy_used
+    LEFT JOIN error_kinds e ON e.message = a.error_message
+    """)
+    cursor.execute("DROP TABLE access_logs")
+    cursor.execute("CREATE INDEX idx_access_log_entries_link_id ON access_log_entries (link_id)")
+    cursor.execute("CREATE INDEX idx_access_log_entries_access_time ON access_log_entries (access_time)")
+
+    cursor.execute("""
+    CREATE TABLE proxy_usage_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        link_id INTEGER NOT NULL,
+        proxy_id INTEGER NOT NULL REFERENCES proxies (id),
+        cycle INTEGER NOT NULL,
+        used_at INTEGER NOT NULL,
+        FOREIGN KEY (link_id) REFERENCES links (id),
+        UNIQUE (link_id, proxy_id, cycle)
+    )
+    """)
+    cursor.execute("""
+    INSERT INTO proxy_usage_entries (id, link_id, proxy_id, cycle, used_at)
+    SELECT u.id, u.link_id, p.id, u.cycle, u.used_at
+    FROM proxy_usage u
+    JOIN proxies p ON p.url = u.proxy
+    """)
+    cursor.execute("DROP TABLE proxy_usage")
+    cursor.execute("CREATE INDEX idx_proxy_usage_entries_link_id_used_at ON proxy_usage_entries (link_id, used_at)")
+
+    # Read-only views with the old columns, for /query and anything else reading the log tables by name
+    cursor.execute("""
+    CREATE VIEW access_logs AS
+    SELECT a.id, a.link_id, a.access_time, p.url AS proxy_used, a.status_code, e.message AS error_message,
+           a.cycle, a.failure_kind, a.bytes_in, a.bytes_out
+    FROM access_log_entries a
+    LEFT JOIN proxies p ON p.id = a.proxy_id
+    LEFT JOIN error_kinds e ON e.id = a.error_kind_id
+    """)
+    cursor.execute("""
+    CREATE VIEW proxy_usage AS
+    SELECT u.id, u.link_id, p.url AS proxy, u.cycle, u.used_at
+    FROM proxy_usage_entries u
+    JOIN proxies p ON p.id = u.proxy_id
+    """)
+
+
+def _migration_6_soft_delete(cursor):
+    """Mark deleted links instead of removing them in the request; a purger removes their rows later"""
+    cursor.execute("ALTER TABLE links ADD COLUMN deleted_at INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_links_deleted_at ON links (deleted_at) WHERE deleted_at IS NOT NULL")
+
+
+def _migration_7_job_claims(cursor):
+    """Let one process at a time run a database-wide job, such as a backup, by claiming it by name"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS job_claims (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        claimed_at REAL NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    ''')
+
+
+# Ordered schema migrations. PRAGMA user_version records how many have been applied;
+# append new migrations to the end and never reorder or edit applied ones.
+MIGRATIONS = [
+    _migration_1_baseline,
+    _migration_2_access_bytes,
+    _migration_3_link_change_tracking,
+    _migration_4_epoch_timestamps,
+    _migration_5_dictionary_tables,
+    _migration_6_soft_delete,
+    _migration_7_job_claims,
+]
+
+# Fractional part of the golden ratio: adding it over and over spreads values evenly over [0, 1)
+PHASE_STEP = 0.6180339887498949
+
+# Dictionary tables and the column holding their values
+DICTIONARY_COLUMNS = {'proxies': 'url', 'error_kinds': 'message'}
+# Most ids cached per dictionary table before the cache starts over
+DICTIONARY_CACHE_SIZE = 10000
+# Tables that STORAGE_SHARDS splits across files by link id
+LOG_TABLES = ('access_log_entries', 'proxy_usage_entries')
+# Most storage shards: /query attaches all of them to one connection, and SQLite attaches at most 10
+MAX_STORAGE_SHARDS = 10
+
+
+def _dictionary_id(store, table, value):
+    """
+    Id of value in the proxies or error_kinds table of store (a Database or LogShard), adding it if it
+    is new. Call it before writing anything else: a new value is committed at once, so a cached id
+    never refers to a rolled back row.
+    """
+    if value is None:
+        return None
+    ids = store._dictionary_ids[table]
+    value_id = ids.get(value)
+    if value_id is None:
+        column = DICTIONARY_COLUMNS[table]
+        conn = store.get_connection()
+        if conn.execute(f"INSERT OR IGNORE INTO {table} ({column}) VALUES (?)", (value,)).rowcount:
+            conn.commit()
+        value_id = conn.execute(f"SELECT id FROM {table} WHERE {column} = ?", (value,)).fetchone()[0]
+        if len(ids) >= DICTIONARY_CACHE_SIZE:
+            ids.clear()
+        ids[value] = value_id
+    return value_id
+
+
+def _delete_link_logs(conn, link_id, limit):
+    """Delete up to limit access log and proxy usage rows of a link without committing. Returns how many"""
+    deleted = 0
+    for table in LOG_TABLES:
+        cursor = conn.execute(f"""
+            DELETE FROM {table}
+            WHERE id IN (SELECT id FROM {table} WHERE link_id = ? LIMIT ?)
+        """, (link_id, limit - deleted))
+        deleted += cursor.rowcount
+        if deleted >= limit:
+            break
+    return deleted
+
+
+def shard_path(db_name, index):
+    """File holding storage shard index of db_name, e.g. links.shard0.db"""
+    base, extension = os.path.splitext(db_name)
+    return f"{base}.shard{index}{extension or '.db'}"
+
+
+def _init_log_shard(cursor, index, count):
+    """Create the log tables of a storage shard, with the same names and views as the main database"""
+    cursor.execute("CREATE TABLE shard_info (shard_index INTEGER NOT NULL, shard_count INTEGER NOT NULL)")
+    cursor.execute("INSERT INTO shard_info (shard_index, shard_count) VALUES (?, ?)", (index, count))
+    cursor.execute("CREATE TABLE proxies (id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE)")
+    cursor.execute("CREATE TABLE error_kinds (id INTEGER PRIMARY KEY, message TEXT NOT NULL UNIQUE)")
+    # link_id refers to links in the main database, so there is no foreign key for it here
+    cursor.execute("""
+    CREATE TABLE access_log_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        link_id INTEGER NOT NULL,
+        access_time INTEGER NOT NULL,
+        proxy_id INTEGER REFERENCES proxies (id),
+        status_code INTEGER,
+        error_kind_id INTEGER REFERENCES error_kinds (id),
+        cycle INTEGER NOT NULL DEFAULT 1,
+        failure_kind TEXT,
+        bytes_in INTEGER,
+        bytes_out INTEGER
+    )
+    """)
+    cursor.execute("CREATE INDEX idx_access_log_entries_link_id ON access_log_entries (link_id)")
+    cursor.execute("CREATE INDEX idx_access_log_entries_access_time ON access_log_entries (access_time)")
+    cursor.execute("""
+    CREATE TABLE proxy_usage_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        link_id INTEGER NOT NULL,
+        proxy_id INTEGER NOT NULL REFERENCES proxies (id),
+        cycle INTEGER NOT NULL,
+        used_at INTEGER NOT NULL,
+        UNIQUE (link_id, proxy_id, cycle)
+    )
+    """)
+    cursor.execute("CREATE INDEX idx_proxy_usage_entries_link_id_used_at ON proxy_usage_entries (link_id, used_at)")
+    cursor.execute("""
+    CREATE VIEW access_logs AS
+    SELECT a.id, a.link_id, a.access_time, p.url AS proxy_used, a.status_code, e.message AS error_message,
+           a.cycle, a.failure_kind, a.bytes_in, a.bytes_out
+    FROM access_log_entries a
+    LEFT JOIN proxies p ON p.id = a.proxy_id
+    LEFT JOIN error_kinds e ON e.id = a.error_kind_id
+    """)
+    cursor.execute("""
+    CREATE VIEW proxy_usage AS
+    SELECT u.id, u.link_id, p.url AS proxy, u.cycle, u.used_at
+    FROM proxy_usage_entries u
+    JOIN proxies p ON p.id = u.proxy_id
+    """)
+
+
+class LogShard:
+    """
+    One storage shard: a database file with the access logs and proxy usage of the links that hash to
+    it. Each shard has its own connection and lock, so writes to different shards never wait on each other.
+    """
+
+    def __init__(self, db_name, index, count):
         self.db_name = db_name
         self.conn = None
-        self.init_db()
+        self.lock = threading.RLock()
+        self._dictionary_ids = {table: {} for table in DICTIONARY_COLUMNS}
+        self._init_db(index, count)
 
     def get_connection(self):
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_name, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row
+            self.conn = _connect(self.db_name)
         return self.conn
 
-    def init_db(self):
-        """Initialize the database with required tables"""
-        try:
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def _init_db(self, index, count):
+        with self.lock:
             conn = self.get_connection()
             cursor = conn.cursor()
+            if not cursor.execute("PRAGMA user_version").fetchone()[0]:
+                cursor.execute("BEGIN IMMEDIATE")
+                try:
+                    if not cursor.execute("PRAGMA user_version").fetchone()[0]:
+                        _init_log_shard(cursor, index, count)
+                        cursor.execute("PRAGMA user_version = 1")
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
 
-            # Create links table with new columns for cycle tracking
-            cursor.execute('''  
-            CREATE TABLE IF NOT EXISTS links (  
-                id INTEGER PRIMARY KEY AUTOINCREMENT,  
-                url TEXT UNIQUE NOT NULL,  
-                date_added TIMESTAMP NOT NULL,  
-                current_cycle_start TIMESTAMP NOT NULL,  
-                current_cycle_end TIMESTAMP NOT NULL,  
-                total_views INTEGER DEFAULT 0,  
-                current_period_views INTEGER DEFAULT 0,  
-                current_cycle INTEGER DEFAULT 1,  
-                active BOOLEAN DEFAULT 1,  
-                filename TEXT,  
-                file_details TEXT  
-            )  
-            ''')
-
-            # Check if we need to update the schema for existing tables
-            cursor.execute("PRAGMA table_info(links)")
-            columns = [column[1] for column in cursor.fetchall()]
+            info = tuple(cursor.execute("SELECT shard_index, shard_count FROM shard_info").fetchone())
+            if info != (index, count):
+                raise ValueError(f"{self.db_name} is shard {info[0] + 1} of {info[1]}, not {index + 1} of {count}; "
+                                 f"changing STORAGE_SHARDS after logs were written is not supported")
 
-            # Add new columns if they don't exist (existing code)
-            if "filename" not in columns:
-                cursor.execute("ALTER TABLE links ADD COLUMN filename TEXT")
-                logger.info("Added filename column to links table")
 
-            if "file_details" not in columns:
-                cursor.execute("ALTER TABLE links ADD COLUMN file_details TEXT")
-                logger.info("Added file_details column to links table")
+_databases = {}
+_databases_lock = threading.Lock()
 
-            if "current_cycle" not in columns:
-                cursor.execute("ALTER TABLE links ADD COLUMN current_cycle INTEGER DEFAULT 1")
-                logger.info("Added current_cycle column to links table")
 
-            if "current_cycle_start" not in columns:
-                cursor.execute("ALTER TABLE links ADD COLUMN current_cycle_start TIMESTAMP")
-                # Update existing records
-                cursor.execute("UPDATE links SET current_cycle_start = date_added WHERE current_cycle_start IS NULL")
-                logger.info("Added current_cycle_start column to links table")
+def get_database(db_name="links.db"):
+    """Return the process-wide Database for db_name, creating it on first use"""
+    with _databases_lock:
+        db = _databases.get(db_name)
+        if db is None:
+            db = _databases[db_name] = Database(db_name)
+        return db
 
-            if "current_cycle_end" not in columns:
-                cursor.execute("ALTER TABLE links ADD COLUMN current_cycle_end TIMESTAMP")
-                # Update existing records
-                cursor.execute(
-                    "UPDATE links SET current_cycle_end = datetime(date_added, '+60 days') WHERE current_cycle_end IS NULL")
-                logger.info("Added current_cycle_end column to links table")
 
-                # End of existing column checks
+class Database:
+    def __init__(self, db_name="links.db"):
+        self.db_name = db_name
+        self.conn = None
+        self.lock = threading.RLock()
+        # Bumped whenever this instance changes links; PRAGMA data_version covers other connections
+        self.links_version = 0
+        self._data_version = None
+        # Ids of values in the dictionary tables, by table and value
+        self._dictionary_ids = {table: {} for table in DICTIONARY_COLUMNS}
+        # New cycles start up to this many seconds late, so links added or rolled over together are spread out
+        self.schedule_jitter = int(float(os.environ.get('SCHEDULE_JITTER_MINUTES', 120)) * 60)
+        self._phase = random.random()
+        self._query_conn = None
+        self.init_db()
+        self.shards = self._open_shards(int(os.environ.get('STORAGE_SHARDS', 1)))
 
-            # Create access logs table
-            cursor.execute('''  
-            CREATE TABLE IF NOT EXISTS access_logs (  
-                id INTEGER PRIMARY KEY AUTOINCREMENT,  
-                link_id INTEGER NOT NULL,  
-                access_time TIMESTAMP NOT NULL,  
-                proxy_used TEXT,  
-                status_code INTEGER,  
-                error_message TEXT,  
-                cycle INTEGER NOT NULL DEFAULT 1,  
-                FOREIGN KEY (link_id) REFERENCES links (id)  
-            )  
-            ''')
+    def get_connection(self):
+        if self.conn is None:
+            self.conn = _connect(self.db_name)
+        return self.conn
 
-            # Add cycle column to access_logs if it doesn't exist
-            cursor.execute("PRAGMA table_info(access_logs)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if "cycle" not in columns:
-                cursor.execute("ALTER TABLE access_logs ADD COLUMN cycle INTEGER NOT NULL DEFAULT 1")
-                logger.info("Added cycle column to access_logs table")
-
-                # Check if proxy_usage table exists
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='proxy_usage'")
-            proxy_usage_exists = cursor.fetchone() is not None
-
-            if not proxy_usage_exists:
-                # Create proxy usage table with updated schema to include per-link cooldown tracking
-                cursor.execute('''  
-                CREATE TABLE IF NOT EXISTS proxy_usage (  
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,  
-                    link_id INTEGER NOT NULL,  
-                    proxy TEXT NOT NULL,  
-                    cycle INTEGER NOT NULL,  
-                    used_at TIMESTAMP NOT NULL,  
-                    FOREIGN KEY (link_id) REFERENCES links (id),  
-                    UNIQUE(link_id, proxy, cycle)  
-                )  
-                ''')
-                logger.info("Created proxy_usage table")
-            else:
-                # Check if the proxy_usage table has the required columns
-                cursor.execute("PRAGMA table_info(proxy_usage)")
-                columns = [column[1] for column in cursor.fetchall()]
-
-                if "used_at" not in columns:
-                    # Since SQLite doesn't support adding constraints to existing columns,
-                    # we need to recreate the table if it's missing the timestamp field
-                    # Temporarily rename the old table
-                    cursor.execute("ALTER TABLE proxy_usage RENAME TO proxy_usage_old")
-
-                    # Create the new table with the proper structure
-                    cursor.execute('''  
-                    CREATE TABLE proxy_usage (  
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,  
-                        link_id INTEGER NOT NULL,  
-                        proxy TEXT NOT NULL,  
-                        cycle INTEGER NOT NULL,  
-                        used_at TIMESTAMP NOT NULL,  
-                        FOREIGN KEY (link_id) REFERENCES links (id),  
-                        UNIQUE(link_id, proxy, cycle)  
-                    )  
-                    ''')
-
-                    # Copy data from old table with a default timestamp for existing records
-                    cursor.execute('''  
-                    INSERT INTO proxy_usage(link_id, proxy, cycle, used_at)  
-                    SELECT link_id, proxy, cycle, datetime('now', '-25 hours')   
-                    FROM proxy_usage_old  
-                    ''')
-
-                    # Drop the old table
-                    cursor.execute("DROP TABLE proxy_usage_old")
-                    logger.info("Updated proxy_usage table with used_at timestamp column")
-
-                    # Create indexes for better performance
-            cursor.execute('''  
-            CREATE INDEX IF NOT EXISTS idx_proxy_usage_link_id_used_at   
-            ON proxy_usage (link_id, used_at)  
-            ''')
+    @_synchronized
+    def close(self):
+        """Close this database's connections and those of its storage shards"""
+        for shard in self.shards:
+            if shard is not self:
+                shard.close()
+        for conn in (self.conn, self._query_conn):
+            if conn is not None:
+                conn.close()
+        self.conn = None
+        self._query_conn = None
 
-            cursor.execute('''  
-            CREATE INDEX IF NOT EXISTS idx_links_active   
-            ON links (active)  
-            ''')
+    @_synchronized
+    def init_db(self):
+        """Initialize the database, applying any schema migrations it hasn't seen yet"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
 
-            cursor.execute('''  
-            CREATE INDEX IF NOT EXISTS idx_access_logs_link_id   
-            ON access_logs (link_id)  
-            ''')
+            # Fast path: an up-to-date database only costs one PRAGMA read
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if version >= len(MIGRATIONS):
+                return
 
-            conn.commit()
-            logger.info("Database initialized successfully")
+            # Take the write lock before re-reading the version so concurrent starts migrate only once
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                version = cursor.execute("PRAGMA user_version").fetchone()[0]
+                for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    migration(cursor)
+                    cursor.execute(f"PRAGMA user_version = {number}")
+                    logger.info(f"Applied schema migration {number} ({migration.__name__})")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            logger.info(f"Database initialized successfully (schema version {len(MIGRATIONS)})")
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
 
+    def _open_shards(self, count):
+        """
+        Storage for the log tables. With count 1 that is this database; otherwise count LogShards,
+        and logs written before sharding was turned on are moved into them.
+        """
+        if self.db_name == ':memory:':
+            return [self]
+        if not 1 <= count <= MAX_STORAGE_SHARDS:
+            raise ValueError(f"STORAGE_SHARDS must be between 1 and {MAX_STORAGE_SHARDS}, not {count}")
+        if count == 1:
+            if os.path.exists(shard_path(self.db_name, 0)):
+                raise ValueError(f"Logs of {self.db_name} are sharded ({shard_path(self.db_name, 0)} exists); "
+                                 f"set STORAGE_SHARDS to the shard count they were written with")
+            return [self]
+
+        shards = [LogShard(shard_path(self.db_name, index), index, count) for index in range(count)]
+        self._move_logs_to_shards(shards)
+        return shards
+
+    @_synchronized
+    def _move_logs_to_shards(self, shards):
+        """Move log rows written to this database before sharding into their shards, one shard per transaction"""
+        conn = self.get_connection()
+        if not conn.execute(f"SELECT {' OR '.join(f'EXISTS (SELECT 1 FROM {table})' for table in LOG_TABLES)}"
+                            ).fetchone()[0]:
+            return
+
+        logger.info(f"Moving the access logs of {self.db_name} into {len(shards)} storage shards")
+        conn.create_function('shard_for', 2, shard_for, deterministic=True)
+        for index, shard in enumerate(shards):
+            conn.execute("ATTACH DATABASE ? AS shard", (shard.db_name,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for table, column in DICTIONARY_COLUMNS.items():
+                    conn.execute(f"INSERT OR IGNORE INTO shard.{table} ({column}) SELECT {column} FROM main.{table}")
+                conn.execute("""
+                    INSERT INTO shard.access_log_entries (link_id, access_time, proxy_id, status_code, error_kind_id,
+                                                          cycle, failure_kind, bytes_in, bytes_out)
+                    SELECT a.link_id, a.access_time, sp.id, a.status_code, se.id, a.cycle, a.failure_kind,
+                           a.bytes_in, a.bytes_out
+                    FROM main.access_log_entries a
+                    LEFT JOIN main.proxies p ON p.id = a.proxy_id
+                    LEFT JOIN shard.proxies sp ON sp.url = p.url
+                    LEFT JOIN main.error_kinds e ON e.id = a.error_kind_id
+                    LEFT JOIN shard.error_kinds se ON se.message = e.message
+                    WHERE shard_for(a.link_id, ?) = ?
+                    ORDER BY a.id
+                """, (len(shards), index))
+                conn.execute("""
+                    INSERT OR IGNORE INTO shard.proxy_usage_entries (link_id, proxy_id, cycle, used_at)
+                    SELECT u.link_id, sp.id, u.cycle, u.used_at
+                    FROM main.proxy_usage_entries u
+                    JOIN main.proxies p ON p.id = u.proxy_id
+                    JOIN shard.proxies sp ON sp.url = p.url
+                    WHERE shard_for(u.link_id, ?) = ?
+                    ORDER BY u.id
+                """, (len(shards), index))
+                for table in LOG_TABLES:
+                    conn.execute(f"DELETE FROM main.{table} WHERE shard_for(link_id, ?) = ?", (len(shards), index))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("DETACH DATABASE shard")
+        logger.info(f"Moved the access logs of {self.db_name} into {len(shards)} storage shards")
+
+    def _shard(self, link_id):
+        """Storage (this database or a LogShard) holding the logs of link_id"""
+        return self.shards[shard_for(link_id, len(self.shards))]
+
+    @_synchronized
+    def _current_cycle(self, link_id):
+        row = self.get_connection().execute("SELECT current_cycle FROM links WHERE id = ? AND deleted_at IS NULL",
+                                            (link_id,)).fetchone()
+        return row['current_cycle'] if row else None
+
+    def _sweep_if_purged(self, shard, link_id):
+        """
+        Called after writing log rows of link_id to a storage shard. A purge that removed the link in between
+        may have swept the shard before the rows arrived, so if the link is gone its rows are deleted here.
+        Returns True if the link is gone
+        """
+        with self.lock:
+            if self.get_connection().execute("SELECT 1 FROM links WHERE id = ?", (link_id,)).fetchone():
+                return False
+        with shard.lock:
+            conn = shard.get_connection()
+            for table in LOG_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE link_id = ?", (link_id,))
+            conn.commit()
+        return True
+
+    def _count_view(self, conn, link_id):
+        conn.execute(
+            "UPDATE links SET total_views = total_views + 1, current_period_views = current_period_views + 1 WHERE id = ?",
+            (link_id,)
+        )
+
+    def _next_cycle_start(self, earliest):
+        """
+        Start of a cycle that may begin at earliest, delayed by a phase within schedule_jitter.
+        Successive phases follow a golden ratio sequence, so links that would otherwise share a start
+        (a bulk import, or a batch rolling over) land evenly over the window instead of being due on
+        the same ticks for their whole schedule. The curve itself is unchanged.
+        """
+        self._phase = (self._phase + PHASE_STEP) % 1
+        return earliest + int(self._phase * self.schedule_jitter)
+
+    @_synchronized
     def add_link(self, url):
         """Add a new link to the database"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            now = datetime.now()
-            cycle_end = now + timedelta(days=60)
+            now = now_ts()
+            cycle_start = self._next_cycle_start(now)
+            cycle_end = cycle_start + CYCLE_SECONDS
 
             cursor.execute(
                 "INSERT INTO links (url, date_added, current_cycle_start, current_cycle_end, current_cycle) VALUES (?, ?, ?, ?, ?)",
-                (url, now, now, cycle_end, 1)
+                (url, now, cycle_start, cycle_end, 1)
             )
             conn.commit()
+            self.links_version += 1
             link_id = cursor.lastrowid
             logger.info(f"Added new link: {url} with ID {link_id}")
             return link_id
@@ -204,111 +784,116 @@ class Database:
             logger.error(f"Error adding link: {e}")
             raise
 
-    def increment_link_views(self, link_id):
+    @_synchronized
+    def delete_link(self, link_id):
         """
-        Increment the view count for a link.
-        If current_period_views reaches 100, increment cycle and reset views.
+        Mark a link deleted and stop scheduling it. Its access logs and proxy usage records are
+        removed afterwards by a worker's Purger, through purge_link_rows
         """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            # First, get the current link information
-            cursor.execute("""  
-                SELECT current_period_views, current_cycle, current_cycle_end   
-                FROM links   
-                WHERE id = ?  
-            """, (link_id,))
-
-            link_data = cursor.fetchone()
-            if not link_data:
-                logger.error(f"Failed to increment views: Link ID {link_id} not found")
+            cursor.execute(
+                "UPDATE links SET active = 0, deleted_at = ? WHERE id = ? AND deleted_at IS NULL",
+                (now_ts(), link_id)
+            )
+            if not cursor.rowcount:
+                logger.warning(f"Attempted to delete non-existent or already deleted link with ID {link_id}")
                 return False
 
-            current_views = link_data['current_period_views']
-            current_cycle = link_data['current_cycle']
-            cycle_end = datetime.strptime(link_data['current_cycle_end'], '%Y-%m-%d %H:%M:%S.%f') if link_data[
-                'current_cycle_end'] else None
-
-            # Check if we need to start a new cycle (current cycle ended)
-            now = datetime.now()
-            if cycle_end and now > cycle_end:
-                # Start a new cycle
-                new_cycle_start = now
-                new_cycle_end = now + timedelta(days=60)  # 60-day cycle
-
-                cursor.execute("""  
-                    UPDATE links   
-                    SET current_cycle = ?,   
-                        current_period_views = 1,  
-                        total_views = total_views + 1,  
-                        current_cycle_start = ?,  
-                        current_cycle_end = ?  
-                    WHERE id = ?  
-                """, (current_cycle + 1, new_cycle_start, new_cycle_end, link_id))
-
-                logger.info(f"Started new cycle {current_cycle + 1} for link ID {link_id}")
-
-                # Regular increment within current cycle
-            else:
-                new_views = current_views + 1
-
-                # Check if we've completed all 100 views for this cycle
-                if new_views >= 120:
-                    # When reaching 100 views, mark cycle as completed but keep the end date
-                    cursor.execute("""  
-                        UPDATE links   
-                        SET current_period_views = ?,  
-                            total_views = total_views + 1  
-                        WHERE id = ?  
-                    """, (new_views, link_id))
-                    logger.info(f"Completed all 100 views for link ID {link_id} in cycle {current_cycle}")
-                else:
-                    # Normal increment
-                    cursor.execute("""  
-                        UPDATE links   
-                        SET current_period_views = ?,  
-                            total_views = total_views + 1  
-                        WHERE id = ?  
-                    """, (new_views, link_id))
-                    logger.info(f"Incremented views for link ID {link_id} to {new_views} in cycle {current_cycle}")
-
             conn.commit()
+            self.links_version += 1
+            logger.info(f"Marked link with ID {link_id} deleted")
             return True
         except Exception as e:
-            logger.error(f"Error incrementing views for link ID {link_id}: {e}")
+            logger.error(f"Error deleting link with ID {link_id}: {e}")
+            conn.rollback()
             return False
 
-    def delete_link(self, link_id):
-        """Delete a link and its associated access logs and proxy usage records"""
+    @_synchronized
+    def get_deleted_link_ids(self):
+        """Ids of links marked deleted whose rows haven't been purged yet, oldest deletion first"""
+        cursor = self.get_connection().execute(
+            "SELECT id FROM links WHERE deleted_at IS NOT NULL ORDER BY deleted_at, id")
+        return [row['id'] for row in cursor.fetchall()]
+
+    def count_link_rows(self, link_id):
+        """Number of access log and proxy usage rows a link has"""
+        shard = self._shard(link_id)
+        with shard.lock:
+            conn = shard.get_connection()
+            return sum(conn.execute(f"SELECT COUNT(*) FROM {table} WHERE link_id = ?", (link_id,)).fetchone()[0]
+                       for table in LOG_TABLES)
+
+    def purge_link_rows(self, link_id, limit):
+        """
+        Delete up to limit access log and proxy usage rows of a deleted link in one transaction, and the
+        link itself once none are left. Returns the number of rows deleted and whether the link is gone.
+        """
+        shard = self._shard(link_id)
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
+            with shard.lock:
+                deleted = _delete_link_logs(shard.get_connection(), link_id, limit)
+                if deleted >= limit:
+                    shard.get_connection().commit()
+                    return deleted, False
+                if shard is self:
+                    # log_access and record_proxy_usage check the link in the transaction that adds a row,
+                    # so no access can add rows once this removes it
+                    self._delete_purged_link(link_id)
+                    return deleted, True
+                shard.get_connection().commit()
+
+            # The logs are in another file: remove the link first, then sweep up rows logged in between.
+            # Rows that arrive after the sweep are removed by the writer, which checks the link afterwards
+            with self.lock:
+                self._delete_purged_link(link_id)
+            with shard.lock:
+                deleted += _delete_link_logs(shard.get_connection(), link_id, limit)
+                shard.get_connection().commit()
+            return deleted, True
+        except Exception as e:
+            logger.error(f"Error purging rows of link ID {link_id}: {e}")
+            for store in {shard, self}:
+                with store.lock:
+                    store.get_connection().rollback()
+            raise
 
-            # First, check if the link exists
-            cursor.execute("SELECT url FROM links WHERE id = ?", (link_id,))
-            result = cursor.fetchone()
-            if not result:
-                logger.warning(f"Attempted to delete non-existent link with ID {link_id}")
-                return False
+    def _delete_purged_link(self, link_id):
+        conn = self.get_connection()
+        conn.execute("DELETE FROM access_leases WHERE link_id = ?", (link_id,))
+        conn.execute("DELETE FROM links WHERE id = ? AND deleted_at IS NOT NULL", (link_id,))
+        conn.commit()
+        self.links_version += 1
 
-                # Delete associated access logs
-            cursor.execute("DELETE FROM access_logs WHERE link_id = ?", (link_id,))
+    @_synchronized
+    def get_link(self, link_id):
+        """Get a single link by id"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
 
-            # Delete associated proxy usage records
-            cursor.execute("DELETE FROM proxy_usage WHERE link_id = ?", (link_id,))
+            cursor.execute("SELECT * FROM links WHERE id = ?", (link_id,))
+            return cursor.fetchone()
+        except Exception as e:
+            logger.error(f"Error fetching link ID {link_id}: {e}")
+            raise
 
-            # Delete the link
-            cursor.execute("DELETE FROM links WHERE id = ?", (link_id,))
+    @_synchronized
+    def get_link_by_url(self, url):
+        """Get a single link by URL"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
 
-            conn.commit()
-            logger.info(f"Deleted link with ID {link_id} (URL: {result['url']})")
-            return True
+            cursor.execute("SELECT * FROM links WHERE url = ?", (url,))
+            return cursor.fetchone()
         except Exception as e:
-            logger.error(f"Error deleting link with ID {link_id}: {e}")
-            conn.rollback()
-            return False
+            logger.error(f"Error fetching link {url}: {e}")
+            raise
 
+    @_synchronized
     def update_link_info(self, link_id, filename, file_details):
         """Update filename and file details for a link"""
         try:
@@ -320,56 +905,111 @@ class Database:
                 (filename, file_details, link_id)
             )
             conn.commit()
-            logger.info(f"Updated info for link ID {link_id}: filename='{filename}', details='{file_details}'")
+            self.links_version += 1
+            access_logger.info("Updated info for link ID %s: filename='%s', details='%s'", link_id, filename,
+                               file_details)
             return True
         except Exception as e:
             logger.error(f"Error updating link info: {e}")
             raise
 
+    @_synchronized
+    def advance_cycles(self, owns_link=None):
+        """
+        Move active links whose cycle has ended to their next cycle, only those owns_link accepts if given.
+        Returns how many moved. Every process sharing the database may run this, so a link only moves if
+        it is still in the cycle that was read: otherwise another process moved it already, and moving it
+        again would reset views counted in the new cycle and shift a start accesses were scheduled against.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+        SELECT id, url, current_cycle, current_cycle_end
+        FROM links
+        WHERE active = 1 AND current_cycle_end < ?
+        ''', (now_ts(),))
+
+        links_to_update = [link for link in cursor.fetchall() if owns_link is None or owns_link(link['id'])]
+
+        # Update links that have completed a cycle
+        moved = 0
+        for link in links_to_update:
+            new_cycle = link['current_cycle'] + 1
+            new_cycle_start = self._next_cycle_start(link['current_cycle_end'])
+            new_cycle_end = new_cycle_start + CYCLE_SECONDS
+
+            cursor.execute('''
+            UPDATE links
+            SET current_cycle = ?,
+                current_period_views = 0,
+                current_cycle_start = ?,
+                current_cycle_end = ?
+            WHERE id = ? AND current_cycle = ? AND current_cycle_end = ?
+            ''', (new_cycle, new_cycle_start, new_cycle_end, link['id'], link['current_cycle'],
+                  link['current_cycle_end']))
+
+            if cursor.rowcount:
+                moved += 1
+                logger.info("Link ID %s moved to cycle %s", link['id'], new_cycle)
+
+        if moved:
+            conn.commit()
+            self.links_version += 1
+        elif links_to_update:
+            conn.rollback()
+        return moved
+
+    @_synchronized
+    def has_external_changes(self):
+        """Check whether another connection committed to the database since the last call"""
+        version = self.get_connection().execute("PRAGMA data_version").fetchone()[0]
+        changed = version != self._data_version
+        self._data_version = version
+        return changed
+
+    @_synchronized
+    def get_change_counters(self):
+        """Current values of the links change counters as a dict"""
+        cursor = self.get_connection().execute("SELECT name, value FROM change_counters")
+        return {row['name']: row['value'] for row in cursor.fetchall()}
+
+    @_synchronized
+    def get_link_states(self, since_seq=0):
+        """
+        Scheduling state of links changed after since_seq, as plain tuples of
+        (id, cycle_start, cycle_end, period_views, cycle, active, change_seq).
+        since_seq=0 loads every active link.
+        """
+        cursor = self.get_connection().cursor()
+        cursor.execute(f"""
+            SELECT id, current_cycle_start, current_cycle_end, current_period_views, current_cycle,
+                   active, change_seq
+            FROM links
+            WHERE change_seq > ? {'' if since_seq else 'AND active = 1'}
+            ORDER BY id
+        """, (since_seq,))
+        return [tuple(row) for row in cursor.fetchall()]
+
+    @_synchronized
     def get_active_links(self):
         """Get all active links with cycle information"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            now = datetime.now()
-
-            # First, check if any links need to move to the next cycle
-            cursor.execute('''  
-            SELECT id, url, current_cycle, current_cycle_end   
-            FROM links   
-            WHERE active = 1 AND current_cycle_end < ?  
-            ''', (now,))
-
-            links_to_update = cursor.fetchall()
+            now = now_ts()
 
-            # Update links that have completed a cycle
-            for link in links_to_update:
-                new_cycle = link['current_cycle'] + 1
-                new_cycle_start = datetime.strptime(link['current_cycle_end'], '%Y-%m-%d %H:%M:%S.%f')
-                new_cycle_end = new_cycle_start + timedelta(days=60)
-
-                cursor.execute('''  
-                UPDATE links   
-                SET current_cycle = ?,   
-                    current_period_views = 0,   
-                    current_cycle_start = ?,   
-                    current_cycle_end = ?   
-                WHERE id = ?  
-                ''', (new_cycle, new_cycle_start, new_cycle_end, link['id']))
-
-                logger.info(f"Link ID {link['id']} moved to cycle {new_cycle}")
-
-            if links_to_update:
-                conn.commit()
+            # First, move any links that finished their cycle to the next one
+            self.advance_cycles()
 
                 # Now get all active links with days remaining in current cycle
             cursor.execute('''  
             SELECT   
                 id, url, date_added, current_cycle_start, current_cycle_end,   
                 total_views, current_period_views, current_cycle,  
-                ROUND(julianday(current_cycle_end) - julianday(?), 1) as days_remaining,  
-                filename, file_details  
+                ROUND((current_cycle_end - ?) / 86400.0, 1) as days_remaining,  
+                filename, file_details, change_seq
             FROM links  
             WHERE active = 1  
             ORDER BY current_cycle_end ASC  
@@ -380,124 +1020,552 @@ class Database:
             logger.error(f"Error fetching active links: {e}")
             raise
 
-    def log_access(self, link_id, proxy_used, status_code=None, error_message=None):
-        """Log an access attempt and track proxy usage"""
+    def log_access(self, link_id, proxy_used, status_code=None, error_message=None, failure_kind=None,
+                   bytes_in=None, bytes_out=None):
+        """
+        Log an access attempt and track proxy usage.
+        failure_kind is proxy, target or parse for failed attempts; bytes_in/bytes_out are the bytes it transferred.
+        error_message is stored once per distinct value in error_kinds, so pass a stable label rather than
+        raw exception text (see retry.describe_error).
+        """
+        now = now_ts()
+        shard = self._shard(link_id)
+        # Logs in another file need the cycle up front; without shards it is read by the insert itself
+        current_cycle = self._current_cycle(link_id) if shard is not self else None
+        if shard is not self and current_cycle is None:
+            logger.error(f"Attempted to log access for non-existent or deleted link ID {link_id}")
+            return False
+
+        # Successful accesses count as views, whether or not they went through a proxy; a failed attempt
+        # can still carry the page's 2xx status (e.g. when the download button is missing), so failures never count
+        counted = bool(status_code and 200 <= status_code < 300 and not failure_kind and not error_message)
+        with shard.lock:
+            try:
+                conn = shard.get_connection()
+                cursor = conn.cursor()
+
+                proxy_id = _dictionary_id(shard, 'proxies', proxy_used)
+                error_kind_id = _dictionary_id(shard, 'error_kinds', error_message)
+
+                # Log the access
+                if shard is self:
+                    # Reading the link in the insert keeps a purge from removing it between the two
+                    cursor.execute("""
+                        INSERT INTO access_log_entries (link_id, access_time, proxy_id, status_code, error_kind_id,
+                                                        cycle, failure_kind, bytes_in, bytes_out)
+                        SELECT id, ?, ?, ?, ?, current_cycle, ?, ?, ?
+                        FROM links
+                        WHERE id = ? AND deleted_at IS NULL
+                    """, (now, proxy_id, status_code, error_kind_id, failure_kind, bytes_in, bytes_out, link_id))
+                    if not cursor.rowcount:
+                        conn.rollback()
+                        logger.error(f"Attempted to log access for non-existent or deleted link ID {link_id}")
+                        return False
+                    current_cycle = self._current_cycle(link_id)
+                else:
+                    cursor.execute(
+                        "INSERT INTO access_log_entries (link_id, access_time, proxy_id, status_code, error_kind_id, cycle, failure_kind, bytes_in, bytes_out) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (link_id, now, proxy_id, status_code, error_kind_id, current_cycle, failure_kind, bytes_in, bytes_out)
+                    )
+
+                if counted:
+                    # If the access used a proxy, record it in proxy_usage. The worker records the proxy
+                    # when it picks it, so the row usually exists already
+                    if proxy_used:
+                        cursor.execute(
+                            "INSERT OR IGNORE INTO proxy_usage_entries (link_id, proxy_id, cycle, used_at) VALUES (?, ?, ?, ?)",
+                            (link_id, proxy_id, current_cycle, now)
+                        )
+
+                    # Without storage shards the view count goes in the same transaction as the log
+                    if shard is self:
+                        self._count_view(conn, link_id)
+
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error logging access: {e}")
+                conn.rollback()
+                return False
+
+        if shard is not self and self._sweep_if_purged(shard, link_id):
+            return False
+
+        if counted and shard is not self:
+            with self.lock:
+                try:
+                    self._count_view(self.get_connection(), link_id)
+                    self.get_connection().commit()
+                except Exception as e:
+                    logger.error(f"Error counting the view of link ID {link_id}: {e}")
+                    self.get_connection().rollback()
+                    return False
+
+        self.links_version += 1
+        access_logger.info("Logged access for link_id %s with status %s in cycle %s", link_id, status_code,
+                           current_cycle)
+        return True
+
+    def get_bandwidth_summary(self, hours=24, limit=10):
+        """
+        Bytes transferred by accesses in the last hours: totals, bytes per successful view,
+        and the top proxies and links by traffic, added up over every storage shard
+        """
+        try:
+            since = now_ts() - hours * 3600
+            summary = {'accesses': 0, 'views': 0, 'bytes_in': 0, 'bytes_out': 0}
+            groups = {'proxies': {}, 'links': {}}
+
+            for shard in self.shards:
+                with shard.lock:
+                    cursor = shard.get_connection().cursor()
+                    cursor.execute("""
+                        SELECT COUNT(*) AS accesses,
+                               SUM(CASE WHEN status_code BETWEEN 200 AND 299 AND failure_kind IS NULL
+                                   THEN 1 ELSE 0 END) AS views,
+                               COALESCE(SUM(bytes_in), 0) AS bytes_in,
+                               COALESCE(SUM(bytes_out), 0) AS bytes_out
+                        FROM access_log_entries
+                        WHERE access_time >= ?
+                    """, (since,))
+                    for key, value in dict(cursor.fetchone()).items():
+                        summary[key] += value or 0
+
+                    # Proxies are grouped by id and only the top ones are looked up. A proxy's traffic is
+                    # spread over every shard, so with several of them all proxies are read and added up;
+                    # a link's is in one shard, so its top links are enough
+                    for group, column, name, group_limit in (
+                            ('proxies', 'proxy_id', '(SELECT url FROM proxies WHERE id = proxy_id)',
+                             limit if len(self.shards) == 1 else -1),
+                            ('links', 'link_id', 'link_id', limit)):
+                        cursor.execute(f"""
+                            SELECT {name} AS name, COUNT(*) AS accesses,
+                                   COALESCE(SUM(bytes_in), 0) AS bytes_in,
+                                   COALESCE(SUM(bytes_out), 0) AS bytes_out
+                            FROM access_log_entries
+                            WHERE access_time >= ?
+                            GROUP BY {column}
+                            ORDER BY COALESCE(SUM(bytes_in), 0) + COALESCE(SUM(bytes_out), 0) DESC
+                            LIMIT ?
+                        """, (since, group_limit))
+                        for row in cursor.fetchall():
+                            totals = groups[group].setdefault(row['name'], {'name': row['name'], 'accesses': 0,
+                                                                            'bytes_in': 0, 'bytes_out': 0})
+                            for key in ('accesses', 'bytes_in', 'bytes_out'):
+                                totals[key] += row[key]
+
+            summary['bytes_per_view'] = ((summary['bytes_in'] + summary['bytes_out']) // summary['views']
+                                         if summary['views'] else None)
+            for group, rows in groups.items():
+                summary[group] = sorted(rows.values(), key=lambda row: row['bytes_in'] + row['bytes_out'],
+                                        reverse=True)[:limit]
+            return summary
+        except Exception as e:
+            logger.error(f"Error fetching bandwidth summary: {e}")
+            return None
+
+    def record_proxy_usage(self, link_id, proxy_url):
+        """Record that a proxy was used for a specific link in the current cycle"""
+        shard = self._shard(link_id)
+        # Logs in another file need the cycle up front; without shards it is read by the insert itself
+        current_cycle = self._current_cycle(link_id) if shard is not self else None
+        if shard is not self and current_cycle is None:
+            logger.error(f"Link ID {link_id} not found")
+            return False
+
+        with shard.lock:
+            try:
+                conn = shard.get_connection()
+                cursor = conn.cursor()
+                proxy_id = _dictionary_id(shard, 'proxies', proxy_url)
+
+                # Record the proxy usage with timestamp, or update the timestamp if the proxy was
+                # already used in this cycle
+                if shard is self:
+                    # Reading the link in the insert keeps a purge from removing it between the two
+                    cursor.execute("""
+                        INSERT INTO proxy_usage_entries (link_id, proxy_id, cycle, used_at)
+                        SELECT id, ?, current_cycle, ?
+                        FROM links
+                        WHERE id = ? AND deleted_at IS NULL
+                        ON CONFLICT (link_id, proxy_id, cycle) DO UPDATE
+                        SET used_at = excluded.used_at
+                    """, (proxy_id, now_ts(), link_id))
+                    if not cursor.rowcount:
+                        conn.rollback()
+                        logger.error(f"Link ID {link_id} not found")
+                        return False
+                else:
+                    try:
+                        cursor.execute("""
+                            INSERT INTO proxy_usage_entries (link_id, proxy_id, cycle, used_at)
+                            VALUES (?, ?, ?, ?)
+                        """, (link_id, proxy_id, current_cycle, now_ts()))
+                    except sqlite3.IntegrityError:
+                        cursor.execute("""
+                            UPDATE proxy_usage_entries
+                            SET used_at = ?
+                            WHERE link_id = ? AND proxy_id = ? AND cycle = ?
+                        """, (now_ts(), link_id, proxy_id, current_cycle))
+
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error recording proxy usage: {e}")
+                return False
+
+        # A purge in between is swept up here
+        return shard is self or not self._sweep_if_purged(shard, link_id)
+
+    def get_recent_proxies_for_link(self, link_id, cooldown_hours=24):
+        """Get the set of proxies used for this link within the cooldown period"""
+        shard = self._shard(link_id)
+        with shard.lock:
+            cursor = shard.get_connection().cursor()
+            cursor.execute("""
+                SELECT p.url FROM proxy_usage_entries u
+                JOIN proxies p ON p.id = u.proxy_id
+                WHERE u.link_id = ? AND u.used_at > ?
+            """, (link_id, now_ts() - cooldown_hours * 3600))
+
+            return {row['url'] for row in cursor.fetchall()}
+
+    @_synchronized
+    def claim_lease(self, link_id, view_index, owner, ttl_seconds):
+        """
+        Atomically claim the (link_id, view_index) access for owner.
+        The claim succeeds when no lease exists or the existing lease has expired,
+        and only while the link is still waiting for that view.
+        """
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            now = datetime.now()
+            now = current_time()
+            cursor.execute("""
+                INSERT INTO access_leases (link_id, view_index, owner, claimed_at, expires_at)
+                SELECT ?, ?, ?, ?, ?
+                FROM links
+                WHERE id = ? AND active = 1 AND current_period_views = ?
+                ON CONFLICT (link_id, view_index) DO UPDATE
+                SET owner = excluded.owner,
+                    claimed_at = excluded.claimed_at,
+                    expires_at = excluded.expires_at
+                WHERE access_leases.expires_at < ?
+            """, (link_id, view_index, owner, now, now + ttl_seconds, link_id, view_index, now))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+            return claimed
+        except Exception as e:
+            logger.error(f"Error claiming lease for link ID {link_id}, view {view_index}: {e}")
+            conn.rollback()
+            return False
 
-            # Get the current cycle for this link
-            cursor.execute("SELECT current_cycle FROM links WHERE id = ?", (link_id,))
-            result = cursor.fetchone()
-            if not result:
-                logger.error(f"Attempted to log access for non-existent link ID {link_id}")
-                return False
+    @_synchronized
+    def renew_lease(self, link_id, view_index, owner, ttl_seconds):
+        """Extend a lease held by owner. Returns False if the lease was lost"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
 
-            current_cycle = result['current_cycle']
+            cursor.execute("""
+                UPDATE access_leases
+                SET expires_at = ?
+                WHERE link_id = ? AND view_index = ? AND owner = ?
+            """, (current_time() + ttl_seconds, link_id, view_index, owner))
+            renewed = cursor.rowcount == 1
+            conn.commit()
+            return renewed
+        except Exception as e:
+            logger.error(f"Error renewing lease for link ID {link_id}, view {view_index}: {e}")
+            conn.rollback()
+            return False
+
+    @_synchronized
+    def release_lease(self, link_id, view_index, owner):
+        """Release a lease held by owner"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
 
-            # Log the access
             cursor.execute(
-                "INSERT INTO access_logs (link_id, access_time, proxy_used, status_code, error_message, cycle) VALUES (?, ?, ?, ?, ?, ?)",
-                (link_id, now, proxy_used, status_code, error_message, current_cycle)
+                "DELETE FROM access_leases WHERE link_id = ? AND view_index = ? AND owner = ?",
+                (link_id, view_index, owner)
             )
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error releasing lease for link ID {link_id}, view {view_index}: {e}")
+            conn.rollback()
+            return False
 
-            # If access was successful and used a proxy, record it in proxy_usage
-            if status_code and 200 <= status_code < 300 and proxy_used:
-                try:
-                    cursor.execute(
-                        "INSERT INTO proxy_usage (link_id, proxy, cycle, used_at) VALUES (?, ?, ?, ?)",
-                        (link_id, proxy_used, current_cycle, now)
-                    )
-                except sqlite3.IntegrityError:
-                    # This proxy was already used for this link in this cycle
-                    # This shouldn't happen with our logic, but handle it just in case
-                    logger.warning(
-                        f"Proxy {proxy_used} was already recorded for link ID {link_id} in cycle {current_cycle}")
-
-                    # Update view counts
-                cursor.execute(
-                    "UPDATE links SET total_views = total_views + 1, current_period_views = current_period_views + 1 WHERE id = ?",
-                    (link_id,)
-                )
+    @_synchronized
+    def cool_down_lease(self, link_id, view_index, owner, until):
+        """
+        Hand a lease held by owner over to COOLDOWN_OWNER until epoch time until, so no worker
+        claims the view slot again before then. Returns False if owner didn't hold the lease
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute("""
+                UPDATE access_leases
+                SET owner = ?, expires_at = ?
+                WHERE link_id = ? AND view_index = ? AND owner = ?
+            """, (COOLDOWN_OWNER, until, link_id, view_index, owner))
+            cooled_down = cursor.rowcount == 1
+            conn.commit()
+            return cooled_down
+        except Exception as e:
+            logger.error(f"Error cooling down lease for link ID {link_id}, view {view_index}: {e}")
+            conn.rollback()
+            return False
+
+    @_synchronized
+    def claim_job(self, name, owner, ttl_seconds):
+        """
+        Atomically claim the job name for owner, so workers sharing the database don't run it at once.
+        The claim succeeds when nobody holds it or the holder's claim has expired.
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            now = current_time()
+            cursor.execute("""
+                INSERT INTO job_claims (name, owner, claimed_at, expires_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (name) DO UPDATE
+                SET owner = excluded.owner,
+                    claimed_at = excluded.claimed_at,
+                    expires_at = excluded.expires_at
+                WHERE job_claims.expires_at < ?
+            """, (name, owner, now, now + ttl_seconds, now))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+            return claimed
+        except Exception as e:
+            logger.error(f"Error claiming job {name}: {e}")
+            conn.rollback()
+            return False
 
+    @_synchronized
+    def release_job(self, name, owner):
+        """Release a job claim held by owner"""
+        try:
+            conn = self.get_connection()
+            conn.execute("DELETE FROM job_claims WHERE name = ? AND owner = ?", (name, owner))
             conn.commit()
-            logger.info(f"Logged access for link_id {link_id} with status {status_code} in cycle {current_cycle}")
             return True
         except Exception as e:
-            logger.error(f"Error logging access: {e}")
+            logger.error(f"Error releasing job {name}: {e}")
             conn.rollback()
             return False
 
-    def record_proxy_usage(self, link_id, proxy_url):
-        """Record that a proxy was used for a specific link in the current cycle"""
+    @_synchronized
+    def release_leases_for_owner(self, owner):
+        """Release every lease held by owner, e.g. on worker shutdown"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            # Get the current cycle for this link
-            cursor.execute("SELECT current_cycle FROM links WHERE id = ?", (link_id,))
-            link_data = cursor.fetchone()
+            cursor.execute("DELETE FROM access_leases WHERE owner = ?", (owner,))
+            conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error releasing leases for {owner}: {e}")
+            conn.rollback()
+            return 0
 
-            if not link_data:
-                logger.error(f"Link ID {link_id} not found")
-                return False
+    @_synchronized
+    def reclaim_expired_leases(self):
+        """Delete leases whose owner stopped renewing them, and cooldowns that have ended"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
 
-            current_cycle = link_data[0]
+            now = current_time()
+            cursor.execute("DELETE FROM access_leases WHERE expires_at < ? AND owner = ?", (now, COOLDOWN_OWNER))
+            cursor.execute("DELETE FROM access_leases WHERE expires_at < ?", (now,))
+            reclaimed = cursor.rowcount
+            conn.commit()
+            if reclaimed:
+                logger.warning(f"Reclaimed {reclaimed} expired access leases")
+            return reclaimed
+        except Exception as e:
+            logger.error(f"Error reclaiming expired leases: {e}")
+            conn.rollback()
+            return 0
 
-            # Record the proxy usage with timestamp
-            try:
-                cursor.execute("""  
-                    INSERT INTO proxy_usage (link_id, proxy, cycle, used_at)  
-                    VALUES (?, ?, ?, datetime('now'))  
-                """, (link_id, proxy_url, current_cycle))
-            except sqlite3.IntegrityError:
-                # If there's a uniqueness constraint violation (proxy already used in this cycle),
-                # update the timestamp instead
-                cursor.execute("""  
-                    UPDATE proxy_usage  
-                    SET used_at = datetime('now')  
-                    WHERE link_id = ? AND proxy = ? AND cycle = ?  
-                """, (link_id, proxy_url, current_cycle))
+    @_synchronized
+    def enqueue_command(self, command, payload=None):
+        """Queue a command for the worker processes"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute(
+                "INSERT INTO worker_commands (command, payload, created_at) VALUES (?, ?, ?)",
+                (command, json.dumps(payload) if payload is not None else None, time.time())
+            )
+            conn.commit()
+            logger.info(f"Queued worker command {command} ({cursor.lastrowid}) with payload {payload}")
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Error queueing worker command {command}: {e}")
+            conn.rollback()
+            raise
+
+    @_synchronized
+    def claim_commands(self, owner, limit=20, stale_after=300):
+        """
+        Claim pending worker commands for owner.
+        Commands claimed by a worker that never completed them are handed out again after stale_after seconds.
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            now = time.time()
+            cursor.execute("""
+                SELECT id, command, payload FROM worker_commands
+                WHERE completed_at IS NULL AND (claimed_by IS NULL OR claimed_at < ?)
+                ORDER BY id
+                LIMIT ?
+            """, (now - stale_after, limit))
+
+            claimed = []
+            for row in cursor.fetchall():
+                cursor.execute("""
+                    UPDATE worker_commands
+                    SET claimed_by = ?, claimed_at = ?
+                    WHERE id = ? AND completed_at IS NULL AND (claimed_by IS NULL OR claimed_at < ?)
+                """, (owner, now, row['id'], now - stale_after))
+                if cursor.rowcount == 1:
+                    claimed.append({
+                        'id': row['id'],
+                        'command': row['command'],
+                        'payload': json.loads(row['payload']) if row['payload'] else {}
+                    })
 
+            conn.commit()
+            return claimed
+        except Exception as e:
+            logger.error(f"Error claiming worker commands: {e}")
+            conn.rollback()
+            return []
+
+    @_synchronized
+    def complete_command(self, command_id, error=None):
+        """Mark a worker command as done, recording an error message if it failed"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+
+            cursor.execute(
+                "UPDATE worker_commands SET completed_at = ?, error = ? WHERE id = ?",
+                (time.time(), error, command_id)
+            )
             conn.commit()
             return True
         except Exception as e:
-            logger.error(f"Error recording proxy usage: {e}")
+            logger.error(f"Error completing worker command {command_id}: {e}")
+            conn.rollback()
             return False
 
-    def get_unused_proxies_for_link(self, link_id, all_proxies, cooldown_hours=24):
-        """Get proxies that haven't been used for this link within the cooldown period"""
+    @_synchronized
+    def update_worker_status(self, worker_id, hostname, pid, started_at, status):
+        """Publish the status of a worker process"""
         try:
             conn = self.get_connection()
             cursor = conn.cursor()
 
-            # Get proxies used for this link within the cooldown period
-            cursor.execute("""  
-                SELECT proxy_url FROM proxy_usage  
-                WHERE link_id = ? AND used_at > datetime('now', ?)  
-            """, (link_id, f'-{cooldown_hours} hours'))
+            cursor.execute("""
+                INSERT INTO worker_status (worker_id, hostname, pid, started_at, updated_at, status)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (worker_id) DO UPDATE
+                SET updated_at = excluded.updated_at,
+                    status = excluded.status
+            """, (worker_id, hostname, pid, started_at, time.time(), json.dumps(status)))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error updating status for worker {worker_id}: {e}")
+            conn.rollback()
+            return False
 
-            used_proxies = {row['proxy_url'] for row in cursor.fetchall()}
+    @_synchronized
+    def remove_worker_status(self, worker_id):
+        """Remove a worker's status row when it shuts down"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
 
-            # Return proxies that haven't been used within the cooldown period
-            unused_proxies = [proxy for proxy in all_proxies if proxy not in used_proxies]
+            cursor.execute("DELETE FROM worker_status WHERE worker_id = ?", (worker_id,))
+            conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error removing status for worker {worker_id}: {e}")
+            conn.rollback()
+            return False
 
-            if not unused_proxies:
-                logger.warning(f"All proxies have been used for link {link_id} within the past {cooldown_hours} hours")
-                # If all are used, return all proxies - we'll have to reuse one
-                return all_proxies
+    @_synchronized
+    def get_worker_statuses(self, max_age_seconds=120):
+        """Get the status of every worker that reported within max_age_seconds"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
 
-            return unused_proxies
+            cursor.execute("""
+                SELECT worker_id, hostname, pid, started_at, updated_at, status
+                FROM worker_status
+                WHERE updated_at >= ?
+                ORDER BY started_at
+            """, (time.time() - max_age_seconds,))
+
+            statuses = []
+            for row in cursor.fetchall():
+                status = dict(row)
+                status['status'] = json.loads(row['status']) if row['status'] else {}
+                statuses.append(status)
+            return statuses
         except Exception as e:
-            logger.error(f"Error getting unused proxies: {e}")
-            return all_proxies  # Return all proxies in case of error
-
+            logger.error(f"Error fetching worker statuses: {e}")
+            return []
+
+    @_synchronized
+    def count_live_workers(self, max_age_seconds=120):
+        """Number of workers that reported within max_age_seconds"""
+        return self.get_connection().execute("SELECT COUNT(*) FROM worker_status WHERE updated_at >= ?",
+                                             (time.time() - max_age_seconds,)).fetchone()[0]
+
+    @_synchronized
+    def get_worker_status_version(self):
+        """Number of worker status rows and the time of the latest report, which change whenever a worker publishes"""
+        row = self.get_connection().execute("SELECT COUNT(*), MAX(updated_at) FROM worker_status").fetchone()
+        return tuple(row)
+
+    def _get_query_connection(self):
+        """
+        Connection for raw queries. With storage shards it has every shard attached (as shard0, shard1, ...)
+        and temporary access_logs and proxy_usage views that combine them, shadowing the empty main ones.
+        """
+        if len(self.shards) == 1:
+            return self.get_connection()
+        if self._query_conn is None:
+            conn = _connect(self.db_name)
+            for index, shard in enumerate(self.shards):
+                conn.execute(f"ATTACH DATABASE ? AS shard{index}", (shard.db_name,))
+            for view in ('access_logs', 'proxy_usage'):
+                conn.execute(f"CREATE TEMP VIEW {view} AS " + " UNION ALL ".join(
+                    f"SELECT * FROM shard{index}.{view}" for index in range(len(self.shards))))
+            self._query_conn = conn
+        return self._query_conn
+
+    @_synchronized
     def execute_raw_query(self, query):
         """Execute a raw SQL query and return results"""
         try:
-            conn = self.get_connection()
+            conn = self._get_query_connection()
             cursor = conn.cursor()
             cursor.execute(query)
 
@@ -0,0 +1,66 @@
+# delay_queue.py
+import heapq
+import itertools
+import logging
+import time
+from threading import Condition, Thread
+
+logger = logging.getLogger(__name__)
+
+
+class DelayQueue:
+    """
+    Runs callbacks on an executor once their delay has expired.
+    Waiting happens on a single timer thread, so executor threads are only busy while a callback runs.
+    """
+
+    def __init__(self, executor, name="delay-queue"):
+        self.executor = executor
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = Condition()
+        self._stopped = False
+        self._thread = Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap)
+
+    def call_later(self, delay, function, *args):
+        """Submit function(*args) to the executor after delay seconds"""
+        self.call_at(time.monotonic() + max(0, delay), function, *args)
+
+    def call_at(self, due, function, *args):
+        """Submit function(*args) to the executor once time.monotonic() reaches due"""
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("DelayQueue has been stopped")
+            heapq.heappush(self._heap, (due, next(self._sequence), function, args))
+            # Wake the timer thread if this entry is now the earliest one
+            if self._heap[0][0] == due:
+                self._condition.notify()
+
+    def stop(self):
+        """Stop the timer thread and drop any callbacks that have not run yet"""
+        with self._condition:
+            self._stopped = True
+            dropped = len(self._heap)
+            self._heap.clear()
+            self._condition.notify()
+        return dropped
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, function, args = heapq.heappop(self._heap)
+
+            try:
+                self.executor.submit(function, *args)
+            except Exception as e:
+                logger.error(f"Could not submit delayed call {getattr(function, '__name__', function)}: {e}")
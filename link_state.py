@@ -0,0 +1,144 @@
+# link_state.py
+import bisect
+import logging
+from array import array
+from timestamps import to_epoch
+
+logger = logging.getLogger(__name__)
+
+VIEWS_PER_CYCLE = 120
+
+
+def access_offset(view_index, cycle_seconds, total_accesses=VIEWS_PER_CYCLE):
+    """Seconds from cycle start to the view_index-th access (same x**3 curve as LinkWorker._calculate_access_times)"""
+    return (view_index / (total_accesses - 1)) ** 3 * cycle_seconds
+
+
+def accesses_due(elapsed, cycle_seconds, total_accesses=VIEWS_PER_CYCLE):
+    """Number of accesses whose scheduled time is at most elapsed seconds into the cycle"""
+    if elapsed < 0:
+        return 0
+    if elapsed >= cycle_seconds:
+        return total_accesses
+    count = int((total_accesses - 1) * (elapsed / cycle_seconds) ** (1 / 3)) + 1
+    # Correct for floating point error at the boundaries of the inverse
+    while count < total_accesses and access_offset(count, cycle_seconds, total_accesses) <= elapsed:
+        count += 1
+    while count > 0 and access_offset(count - 1, cycle_seconds, total_accesses) > elapsed:
+        count -= 1
+    return count
+
+
+class LinkStateTable:
+    """
+    Compact copy of the scheduling state of active links, kept in parallel arrays sorted by id
+    (about 32 bytes per link). It is loaded once and then refreshed incrementally from the rows
+    the links change counter says were touched, so a tick without changes reads no tables.
+    """
+
+    def __init__(self):
+        self.ids = array('q')
+        self.cycle_starts = array('d')
+        self.cycle_ends = array('d')
+        self.views = array('i')
+        self.cycles = array('i')
+        self.seq = 0
+        self.deleted_seq = None
+        self.local_version = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def refresh(self, db):
+        """Bring the table up to date with the database. Returns True if anything was reloaded"""
+        local_version = db.links_version
+        external_changes = db.has_external_changes()
+        if local_version == self.local_version and not external_changes:
+            return False
+        self.local_version = local_version
+
+        counters = db.get_change_counters()
+        if counters.get('links_deleted') != self.deleted_seq:
+            # Rows were deleted, which leaves no change stamp behind: reload everything
+            self.deleted_seq = counters.get('links_deleted')
+            self._load(db.get_link_states(0), replace=True)
+        elif counters.get('links', 0) > self.seq:
+            self._load(db.get_link_states(self.seq), replace=False)
+        return True
+
+    def _load(self, rows, replace):
+        if replace:
+            for column in (self.ids, self.cycle_starts, self.cycle_ends, self.views, self.cycles):
+                del column[:]
+            self.seq = 0
+
+        for link_id, cycle_start, cycle_end, views, cycle, active, change_seq in rows:
+            self.seq = max(self.seq, change_seq)
+            index = bisect.bisect_left(self.ids, link_id)
+            exists = index < len(self.ids) and self.ids[index] == link_id
+
+            if not active:
+                if exists:
+                    self._remove(index)
+                continue
+
+            try:
+                start, end = to_epoch(cycle_start), to_epoch(cycle_end)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Skipping link ID {link_id} with unreadable cycle dates: {e}")
+                continue
+
+            if exists:
+                self.cycle_starts[index] = start
+                self.cycle_ends[index] = end
+                self.views[index] = views
+                self.cycles[index] = cycle
+            else:
+                self.ids.insert(index, link_id)
+                self.cycle_starts.insert(index, start)
+                self.cycle_ends.insert(index, end)
+                self.views.insert(index, views)
+                self.cycles.insert(index, cycle)
+
+        logger.info(f"Link state table {'loaded' if replace else 'refreshed'}: {len(rows)} rows read, "
+                    f"{len(self.ids)} active links")
+
+    def _remove(self, index):
+        for column in (self.ids, self.cycle_starts, self.cycle_ends, self.views, self.cycles):
+            del column[index]
+
+    def cycle_of(self, link_id):
+        """Current cycle of an active link, or None if the link isn't in the table"""
+        index = bisect.bisect_left(self.ids, link_id)
+        if index < len(self.ids) and self.ids[index] == link_id:
+            return self.cycles[index]
+        return None
+
+    def needs_rollover(self, now, owns_link=None):
+        """Check whether the cycle of any link (any that owns_link accepts, if given) has ended"""
+        if owns_link is None:
+            return bool(self.cycle_ends) and min(self.cycle_ends) < now
+        return any(end < now and owns_link(link_id) for link_id, end in zip(self.ids, self.cycle_ends))
+
+    def due(self, now, owns_link=None):
+        """
+        Yield (link_id, view_index, next_access_time, deficit) for every link whose next access is due at
+        epoch time now. deficit is how many scheduled accesses the link is behind, including the due one.
+        """
+        ids, starts, ends, views = self.ids, self.cycle_starts, self.cycle_ends, self.views
+        for index in range(len(ids)):
+            view_index = views[index]
+            if view_index >= VIEWS_PER_CYCLE:
+                continue
+
+            start = starts[index]
+            cycle_seconds = ends[index] - start
+            next_access_time = start + access_offset(view_index, cycle_seconds)
+            if next_access_time > now:
+                continue
+
+            link_id = ids[index]
+            if owns_link is not None and not owns_link(link_id):
+                continue
+
+            yield link_id, view_index, next_access_time, accesses_due(now - start, cycle_seconds) - view_index
@@ -0,0 +1,122 @@
+# logging_config.py
+"""
+Process-wide logging setup.
+
+Loggers hand records to a queue and a listener thread writes them to a size-rotated log file and
+the console, so threads that log never wait for disk. A rotating file must have a single writer, so
+every process that runs a listener gets a file of its own; child processes send their records to the
+parent's listener instead. Per-access INFO messages go to "<module>.access"
+loggers from get_access_logger, which keep only a sample of them.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime
+
+LOG_FILE = "link_system.log"
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_configured_pid = None
+_listener = None
+_log_queue = None
+_access_sample_rate = 1.0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler for a listener in the same process: the record is queued untouched, so the
+    message is only formatted by the listener thread"""
+
+    def prepare(self, record):
+        return record
+
+
+class _SamplingFilter(logging.Filter):
+    """Pass every warning and above, and a random share of the rest set by ACCESS_LOG_SAMPLE_RATE"""
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < _access_sample_rate
+
+
+def get_access_logger(name):
+    """Logger for messages emitted on every access; INFO and DEBUG records from it are sampled"""
+    logger = logging.getLogger(f"{name}.access")
+    if not any(isinstance(f, _SamplingFilter) for f in logger.filters):
+        logger.addFilter(_SamplingFilter())
+    return logger
+
+
+def get_log_queue():
+    """Queue of this process's log listener, for child processes to pass to configure_logging"""
+    return _log_queue
+
+
+def configure_logging(log_file=LOG_FILE, log_queue=None, multiprocess=False):
+    """
+    Configure logging for the process once. Entry points call this; library modules only get loggers.
+    log_file is written and rotated by this process alone, so processes started separately must each
+    pass their own. With multiprocess set, the queue can be shared with child processes, which call
+    configure_logging with log_queue=get_log_queue() from the parent to have their records written by its listener.
+    """
+    global _configured_pid, _listener, _log_queue, _access_sample_rate
+    # A forked child inherits the parent's handlers but not its listener thread, so it configures again
+    if _configured_pid == os.getpid():
+        return
+    _configured_pid = os.getpid()
+
+    _access_sample_rate = float(os.environ.get('ACCESS_LOG_SAMPLE_RATE', 0.1))
+    root = logging.getLogger()
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    if log_queue is not None:
+        # Child process: forward records to the parent's listener
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        return
+
+    if os.environ.get('LOG_FORMAT', 'text').lower() == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file,
+        maxBytes=int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+        backupCount=int(os.environ.get('LOG_BACKUP_COUNT', 5))
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    if multiprocess:
+        import multiprocessing
+        _log_queue = multiprocessing.Queue(-1)
+        root.addHandler(logging.handlers.QueueHandler(_log_queue))
+    else:
+        _log_queue = queue.SimpleQueue()
+        root.addHandler(_LocalQueueHandler(_log_queue))
+
+    _listener = logging.handlers.QueueListener(_log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued on exit
+    atexit.register(_listener.stop)
@@ -1,26 +1,161 @@
-# main.py  
-import os  
-import logging  
-from app import app, worker_thread  
-
-if __name__ == "__main__":  
-    # Configure logging  
-    logging.basicConfig(  
-        level=logging.INFO,  
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',  
-        handlers=[  
-            logging.FileHandler("link_system.log"),  
-            logging.StreamHandler()  
-        ]  
-    )  
-    logger = logging.getLogger(__name__)  
-    
-    logger.info("Starting Link Access Dashboard System")  
-    
-    # Start the worker thread  
-    worker_thread.start()  
-    logger.info("Background worker started")  
-    
-    # Run the Flask application  
+# main.py
+import os
+import signal
+import argparse
+import logging
+import multiprocessing
+from dotenv import load_dotenv
+from logging_config import LOG_FILE, configure_logging, get_log_queue
+
+
+def run_web():
+    """Run the dashboard. For production use a WSGI server instead, e.g. `gunicorn -w 4 app:app`"""
+    from app import app
+
     port = int(os.environ.get('PORT', 17545))
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=False)
+
+
+def run_worker():
+    """Run a worker process that performs the scheduled link accesses"""
+    from worker import LinkWorker
+
+    logger = logging.getLogger(__name__)
+    worker = LinkWorker()
+    # Let `kill`/terminate() stop the loop so leases are released on the way out
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop_event.set())
+    try:
+        worker.run(tick_interval=int(os.environ.get('WORKER_TICK_SECONDS', 60)),
+                   poll_interval=int(os.environ.get('WORKER_POLL_SECONDS', 5)))
+    except KeyboardInterrupt:
+        logger.info("Worker interrupted")
+    finally:
+        worker.shutdown()
+
+
+def run_backup(args):
+    """Take a backup now, or restore one for the restore command"""
+    from backup import BACKUP_CLAIM_TTL, BACKUP_JOB, create_backup_manager
+    from db_models import get_database
+
+    logger = logging.getLogger(__name__)
+    backups = create_backup_manager("links.db")
+    if args.command == 'restore':
+        logger.info(f"Restored from {backups.restore(args.snapshot)}")
+        return
+
+    db = get_database("links.db")
+    owner = f"cli:{os.getpid()}"
+    if not db.claim_job(BACKUP_JOB, owner, BACKUP_CLAIM_TTL):
+        raise SystemExit("A worker is taking a backup right now; try again once it has finished")
+    try:
+        stats = backups.run()
+    finally:
+        db.release_job(BACKUP_JOB, owner)
+    logger.info(f"Backup written to {os.path.join(backups.backup_dir, stats['file'])} in {stats['duration']}s")
+
+
+def run_simulation(args):
+    """Replay scheduling over simulated days and print the report"""
+    from link_state import VIEWS_PER_CYCLE
+    from simulator import check_catch_up, run_simulation as simulate
+
+    # Per-access INFO logs would dominate the run time
+    logging.getLogger().setLevel(logging.WARNING)
+    report = simulate(link_count=args.links, days=args.days, tick_seconds=args.tick,
+                      proxy_count=args.proxies, stagger_hours=args.stagger_hours, db_name=args.db)
+
+    print(f"Simulated {report['days']} days of {report['links']} links with {report['proxies']} proxies "
+          f"in {report['wall_seconds']}s ({report['ticks']} ticks of {args.tick}s)")
+    print(f"Accesses: {report['accesses']} ({report['accesses_per_hour']['mean']}/hour on average, "
+          f"peak {report['accesses_per_hour']['peak']}/hour), views counted: {report['views_counted']}")
+    for label, key, unit in (("Scheduler cost per tick", 'tick_ms', 'ms'),
+                             ("Drift behind ideal curve", 'drift_seconds', 's')):
+        summary = report[key]
+        print(f"{label}: mean {summary['mean']}{unit}, p50 {summary['p50']}{unit}, "
+              f"p95 {summary['p95']}{unit}, max {summary['max']}{unit}")
+    print(f"Proxy reuse within 24h: {report['proxy_reuse_violations']}")
+    checks = report['view_checks']
+    print(f"Most accesses of a link in one cycle: {checks['max_cycle_accesses']} (cap {VIEWS_PER_CYCLE}, "
+          f"{checks['cycles_over_cap']} cycles over it), {checks['direct_accesses']} accesses without a proxy")
+    if checks['views_minus_accesses'] or checks['period_view_mismatches']:
+        print(f"VIEW COUNT MISMATCH: {report['views_counted']} views counted for {report['accesses']} accesses, "
+              f"{checks['period_view_mismatches']} links whose period views differ from their accesses")
+    print(f"Links per cycle: {report['links_per_cycle']}")
+
+    if args.catch_up:
+        check = check_catch_up(views_behind=args.catch_up, tick_seconds=args.tick, proxy_count=args.proxies)
+        window_minutes = round(check['window_seconds'] / 60, 1)
+        if check['recovery_seconds'] is None:
+            print(f"CATCH-UP TOO SLOW: a link {args.catch_up} views behind was still behind after {window_minutes} min "
+                  f"({check['accesses']} accesses)")
+        else:
+            print(f"Catch-up: a link {args.catch_up} views behind caught up in {check['recovery_seconds']}s "
+                  f"(window {window_minutes} min)")
+
+
+def _log_file(command):
+    """Log file of a command: link_system.log for the dashboard, one file per shard for workers"""
+    if command in ('web', 'all'):
+        return LOG_FILE
+    if command == 'worker':
+        return f"link_system.worker{os.environ.get('WORKER_SHARD_INDEX', 0)}.log"
+    return f"link_system.{command}.log"
+
+
+def _worker_process(log_queue):
+    # Hand records to the parent's log listener, which writes and rotates the file for both processes
+    configure_logging(log_queue=log_queue)
+    run_worker()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Link Access Dashboard System")
+    parser.add_argument('command', nargs='?', default='all', choices=['web', 'worker', 'all', 'simulate', 'backup', 'restore'],
+                        help="web: dashboard only, worker: access worker only, "
+                             "all: dashboard and one worker in separate processes (default), "
+                             "simulate: replay the scheduler on a simulated clock without network access, "
+                             "backup: snapshot the database now, restore: restore a snapshot (stop workers first)")
+    parser.add_argument('--snapshot', help="backup file to restore (default: the newest in BACKUP_DIR)")
+    simulation = parser.add_argument_group("simulate options")
+    simulation.add_argument('--links', type=int, default=1000, help="number of simulated links")
+    simulation.add_argument('--days', type=float, default=61, help="simulated days to run")
+    simulation.add_argument('--tick', type=int, default=300, help="simulated seconds between scheduler ticks")
+    simulation.add_argument('--proxies', type=int, default=50, help="number of simulated proxies (0: every access uses a direct connection)")
+    simulation.add_argument('--stagger-hours', type=float, default=24,
+                            help="spread the cycle starts of the links over this many hours")
+    simulation.add_argument('--db', default=':memory:', help="database file for the simulation")
+    simulation.add_argument('--catch-up', type=int, default=0, metavar='VIEWS',
+                            help="also check that a link this many views behind catches up within the catch-up window")
+    args = parser.parse_args()
+
+    # Configure logging; in 'all' mode the worker process logs through this process's listener.
+    # Each command rotates a file of its own, so separately started processes never share one
+    configure_logging(log_file=_log_file(args.command), multiprocess=args.command == 'all')
+    logger = logging.getLogger(__name__)
+
+    logger.info(f"Starting Link Access Dashboard System ({args.command})")
+
+    if args.command == 'web':
+        run_web()
+    elif args.command == 'worker':
+        run_worker()
+    elif args.command == 'simulate':
+        run_simulation(args)
+    elif args.command in ('backup', 'restore'):
+        run_backup(args)
+    else:
+        # Start the worker in its own process so scraping never shares the dashboard's interpreter.
+        # Not a daemon: daemonic processes can't start children, and the worker runs a parser process pool
+        worker_process = multiprocessing.Process(target=_worker_process, args=(get_log_queue(),),
+                                                 name="link-worker")
+        worker_process.start()
+        logger.info(f"Background worker started (pid {worker_process.pid})")
+
+        try:
+            run_web()
+        finally:
+            worker_process.terminate()
+            worker_process.join(10)
@@ -0,0 +1,97 @@
+# parsers.py
+"""
+HTML parsing for the worker.
+
+These functions run inside the worker's parser processes, so they take the raw
+response bytes and return only the extracted fields as plain Python data.
+"""
+from urllib.parse import urlparse
+
+
+def _soup(body, encoding=None):
+    # Imported here so only processes that actually parse pages load bs4
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(body, 'html.parser', from_encoding=encoding if isinstance(body, bytes) else None)
+
+
+def parse_link_page(body, encoding=None):
+    """Extract filename, file details and the download button URL from a link page"""
+    soup = _soup(body, encoding)
+
+    # Extract filename from span with class "text-2xl"
+    filename_span = soup.find('span', class_='text-2xl')
+    filename = filename_span.get_text().strip() if filename_span else "Unknown Filename"
+
+    # Extract file details from the 3rd list item sibling to this span
+    file_details = "No details available"
+    if filename_span:
+        # Find the parent element and then the ul tag
+        parent = filename_span.parent
+        ul_tag = parent.find('ul')
+        if ul_tag:
+            # Get the 3rd list item
+            li_items = ul_tag.find_all('li')
+            if len(li_items) >= 3:
+                file_details = li_items[2].get_text().strip()
+
+    # Find the download button
+    download_button = soup.find('a', class_=lambda c: c and 'link-button' in c and 'gay-button' in c)
+
+    return {
+        "filename": filename,
+        "file_details": file_details,
+        "has_download_button": download_button is not None,
+        "download_url": download_button.get('hx-get') if download_button else None
+    }
+
+
+def parse_listing(body, url, encoding=None):
+    """
+    Extract the direct links from a directory listing (table with class="fs").
+    Returns an empty list if the page is not a listing.
+    """
+    soup = _soup(body, encoding)
+
+    # Check if there's a table with class="fs"
+    fs_table = soup.find('table', class_='fs')
+    if not fs_table:
+        return []
+
+    # Find all links with target="_blank" and non-empty href
+    direct_links = []
+    parsed_url = urlparse(url)
+    base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
+    for link in fs_table.find_all('a', target='_blank', href=True):
+        href = link.get('href')
+        if href and not href.startswith('#') and not href == '/':
+            # Make sure the URL is absolute
+            if not href.startswith('http'):
+                # If href starts with /, it's relative to the domain root
+                if href.startswith('/'):
+                    full_url = f"{base_url}{href}"
+                else:
+                    # Otherwise it's relative to the current path
+                    path_parts = parsed_url.path.split('/')
+                    # Remove the last part if it's not empty
+                    if path_parts[-1]:
+                        path_parts = path_parts[:-1]
+                    base_path = '/'.join(path_parts)
+                    full_url = f"{base_url}{base_path}/{href}"
+
+                direct_links.append(full_url)
+            else:
+                direct_links.append(href)
+
+    return direct_links
+
+
+def has_required_markup(body):
+    """
+    Check whether a partially downloaded link page already contains everything parse_link_page
+    needs: the filename span with its details list and the complete download button tag.
+    """
+    button = body.find(b'gay-button')
+    if button == -1 or body.find(b'>', button) == -1:
+        return False
+    filename_span = body.find(b'text-2xl')
+    return filename_span != -1 and body.find(b'</ul>', filename_span) != -1
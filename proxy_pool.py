@@ -0,0 +1,182 @@
+# proxy_pool.py
+"""
+Proxy pool for the worker.
+
+A ProxyPool is an immutable snapshot of the proxy list: the URLs are sorted, deduplicated and packed
+into one bytes blob with an array of offsets, so a proxy's integer id is its index and lists of 100k+
+proxies take a few bytes per entry on top of the URLs themselves. A ProxySource holds the current
+snapshot and replaces it when the file or directory it was loaded from changes. Accesses read the pool
+once when they pick a proxy, so swapping in a new pool never disturbs work that is already in flight.
+"""
+import logging
+import os
+import random
+import time
+from array import array
+from itertools import accumulate
+from threading import Event, Thread
+
+logger = logging.getLogger(__name__)
+
+
+def parse_proxy_list(text):
+    """Split comma or newline separated proxy URLs, skipping blank lines and # comments"""
+    if '#' in text:
+        text = '\n'.join(line.split('#', 1)[0] for line in text.splitlines())
+    # Proxy URLs contain no whitespace, so split() also drops blank entries and surrounding spaces
+    return text.replace(',', '\n').split()
+
+
+class ProxyPool:
+    """Immutable, compact set of proxy URLs interned to integer ids"""
+
+    __slots__ = ('_blob', '_offsets')
+
+    def __init__(self, urls=()):
+        encoded = sorted({url.encode() for url in urls})
+        self._blob = b''.join(encoded)
+        self._offsets = array('I', accumulate(map(len, encoded), initial=0))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, proxy_id):
+        """URL of the proxy with id proxy_id"""
+        if not 0 <= proxy_id < len(self):
+            raise IndexError(f"No proxy with id {proxy_id}")
+        return self._blob[self._offsets[proxy_id]:self._offsets[proxy_id + 1]].decode()
+
+    def __iter__(self):
+        for proxy_id in range(len(self)):
+            yield self[proxy_id]
+
+    def __contains__(self, url):
+        return self.id_of(url) >= 0
+
+    def id_of(self, url):
+        """Integer id of url in this pool, or -1 if it isn't in it"""
+        key = url.encode()
+        blob, offsets = self._blob, self._offsets
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if blob[offsets[middle]:offsets[middle + 1]] < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and blob[offsets[low]:offsets[low + 1]] == key:
+            return low
+        return -1
+
+    def choose(self, exclude=()):
+        """Pick a random proxy that is not in exclude (a collection of URLs), or None if every proxy is"""
+        excluded = sorted({proxy_id for proxy_id in map(self.id_of, exclude) if proxy_id >= 0})
+        free = len(self) - len(excluded)
+        if free <= 0:
+            return None
+        # Map a random rank among the free proxies to its id by stepping over the excluded ids below it
+        proxy_id = random.randrange(free)
+        for excluded_id in excluded:
+            if excluded_id > proxy_id:
+                break
+            proxy_id += 1
+        return self[proxy_id]
+
+    def count_free(self, exclude=()):
+        """Number of proxies in the pool that are not in exclude"""
+        return len(self) - len({proxy_id for proxy_id in map(self.id_of, exclude) if proxy_id >= 0})
+
+
+class ProxySource:
+    """
+    Current proxy pool, loaded from a file or directory of files (one or more proxies per line),
+    or from a fixed list. With a path, a watcher thread checks it every check_interval seconds
+    and swaps in a new pool when it changes; a pool that fails to load leaves the old one in place.
+    """
+
+    def __init__(self, path=None, proxies=(), check_interval=10):
+        self.path = path
+        self.check_interval = check_interval
+        self.pool = ProxyPool(proxies)
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self.error = None
+        self._signature = None
+        self._stop = Event()
+        self._thread = None
+        if path:
+            self.reload()
+
+    def _files(self):
+        if os.path.isdir(self.path):
+            return sorted(os.path.join(self.path, name) for name in os.listdir(self.path)
+                          if not name.startswith('.') and os.path.isfile(os.path.join(self.path, name)))
+        return [self.path]
+
+    def _current_signature(self):
+        """What changes when the proxy files are edited, added or removed"""
+        signature = []
+        for path in self._files():
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def reload(self):
+        """Load the pool from path and swap it in. Returns True if it was loaded"""
+        started = time.perf_counter()
+        try:
+            signature = self._current_signature()
+            urls = []
+            for path in self._files():
+                with open(path, encoding='utf-8') as proxy_file:
+                    urls.extend(parse_proxy_list(proxy_file.read()))
+            pool = ProxyPool(urls)
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"Error loading proxies from {self.path}, keeping the current {len(self.pool)}: {e}")
+            return False
+
+        if not pool:
+            logger.warning(f"No proxies found in {self.path}")
+        # Assigning the attribute is atomic: readers see either the old pool or the new one
+        self.pool = pool
+        self._signature = signature
+        self.loaded_at = time.time()
+        self.reloads += 1
+        self.error = None
+        logger.info(f"Loaded {len(pool)} proxies from {self.path} in "
+                    f"{(time.perf_counter() - started) * 1000:.1f}ms")
+        return True
+
+    def check(self):
+        """Reload the pool if the proxy files changed since the last load"""
+        try:
+            changed = self._current_signature() != self._signature
+        except OSError as e:
+            if self.error != str(e):
+                logger.error(f"Cannot read proxy source {self.path}: {e}")
+            self.error = str(e)
+            return False
+        return changed and self.reload()
+
+    def start(self):
+        """Start watching path for changes"""
+        if not self.path or self._thread is not None:
+            return
+        self._thread = Thread(target=self._watch, name="proxy-watcher", daemon=True)
+        self._thread.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            self.check()
+
+    def stop(self):
+        self._stop.set()
+
+    def get_status(self):
+        return {
+            'source': self.path or 'HTTP_PROXIES',
+            'loaded_at': self.loaded_at,
+            'reloads': self.reloads,
+            'error': self.error
+        }
@@ -0,0 +1,105 @@
+# purge.py
+"""
+Background removal of deleted links.
+
+Deleting a link from the dashboard only marks it deleted, which is a single-row update. The
+Purger then removes its access logs and proxy usage in batches of batch_size rows, committing
+each batch and pausing in between, so the write lock is never held for long and worker commits
+keep going while a link with a long history is removed. The links row goes with the last batch.
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def create_purger(db, owns_link=None):
+    """Build a Purger for db from the PURGE_* environment variables"""
+    return Purger(
+        db,
+        batch_size=int(os.environ.get('PURGE_BATCH_SIZE', 1000)),
+        pause=float(os.environ.get('PURGE_PAUSE_SECONDS', 0.2)),
+        owns_link=owns_link
+    )
+
+
+class Purger:
+    """
+    Removes the rows of links marked deleted, batch by batch. owns_link limits it to the links of one
+    worker shard, so workers sharing a database don't purge the same link at once.
+    """
+
+    def __init__(self, db, batch_size=1000, pause=0.2, owns_link=None):
+        if batch_size < 1:
+            raise ValueError(f"PURGE_BATCH_SIZE must be at least 1, not {batch_size}")
+        self.db = db
+        self.batch_size = batch_size
+        self.pause = pause
+        self.owns_link = owns_link
+        self.running = False
+        self.current = None
+        self.links_purged = 0
+        self.rows_purged = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def pending(self):
+        """Ids of the deleted links this purger is responsible for"""
+        return [link_id for link_id in self.db.get_deleted_link_ids()
+                if self.owns_link is None or self.owns_link(link_id)]
+
+    def run(self):
+        """Purge every pending link. Returns the number of links removed"""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A purge is already running")
+            self.running = True
+
+        purged = 0
+        try:
+            for link_id in self.pending():
+                self._purge_link(link_id)
+                purged += 1
+            self.last_error = None
+            return purged
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"Purge of deleted links failed: {e}")
+            raise
+        finally:
+            self.current = None
+            self.running = False
+
+    def _purge_link(self, link_id):
+        started = time.monotonic()
+        total = self.db.count_link_rows(link_id)
+        self.current = {'link_id': link_id, 'rows_total': total, 'rows_deleted': 0, 'batches': 0}
+        logger.info(f"Purging deleted link ID {link_id} ({total} rows)")
+
+        while True:
+            deleted, finished = self.db.purge_link_rows(link_id, self.batch_size)
+            self.current['rows_deleted'] += deleted
+            self.current['batches'] += 1
+            self.rows_purged += deleted
+            if finished:
+                break
+            # Let workers at the write lock between batches
+            time.sleep(self.pause)
+
+        self.links_purged += 1
+        logger.info(f"Purged link ID {link_id}: {self.current['rows_deleted']} rows in "
+                    f"{self.current['batches']} batches, {time.monotonic() - started:.1f}s")
+
+    def get_status(self):
+        """Purge progress for the status page, or None if nothing was deleted since the worker started"""
+        if not self.running and not self.links_purged and self.last_error is None:
+            return None
+        return {
+            'running': self.running,
+            'current': dict(self.current) if self.current else None,
+            'links_purged': self.links_purged,
+            'rows_purged': self.rows_purged,
+            'error': self.last_error
+        }
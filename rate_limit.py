@@ -0,0 +1,153 @@
+# rate_limit.py
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delay in seconds or an HTTP date) into seconds from now"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        if retry_at.tzinfo is None:
+            retry_at = retry_at.replace(tzinfo=timezone.utc)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        logger.warning(f"Ignoring unparseable Retry-After header: {value}")
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket in its virtual-scheduling form: instead of counting tokens it tracks the time the
+    next token is due, which lets callers reserve a slot for a request they will send later.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.next_free = 0.0
+        self.blocked_until = 0.0
+
+    def reserve(self, at):
+        """Reserve a token for a request wanted at monotonic time at, returning when it may be sent"""
+        interval = 1.0 / self.rate
+        # Up to burst requests may go out back to back before the bucket runs dry
+        send_at = max(at, self.next_free - (self.burst - 1) * interval, self.blocked_until)
+        self.next_free = max(self.next_free, send_at) + interval
+        return send_at
+
+
+class HostRateLimiter:
+    """
+    Per-host token buckets for outbound requests.
+    Honors Retry-After and halves a host's rate when its share of 429/503 responses goes above
+    throttle_threshold, then recovers gradually while responses are healthy.
+    rate, burst and min_rate are totals for all worker processes; set_share splits them between those running.
+    """
+
+    def __init__(self, rate, burst, min_rate=0.05, throttle_threshold=0.1, window=50, decrease_cooldown=30):
+        self.configured_rate = rate
+        self.configured_burst = burst
+        self.configured_min_rate = min(min_rate, rate)
+        self.workers = 1
+        # This process's share of the configured limits
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = self.configured_min_rate
+        self.throttle_threshold = throttle_threshold
+        self.window = window
+        self.decrease_cooldown = decrease_cooldown
+        self._buckets = {}
+        self._outcomes = {}
+        self._last_decrease = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def host_for(url):
+        return urlparse(url).netloc.lower()
+
+    def _bucket(self, host):
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            self._outcomes[host] = deque(maxlen=self.window)
+        return bucket
+
+    def set_share(self, workers):
+        """
+        Split the configured limits between workers processes, which send requests to the same hosts,
+        so that together they stay within them. Buckets keep any slowdown from throttling
+        """
+        workers = max(1, workers)
+        with self._lock:
+            if workers == self.workers:
+                return
+            scale = self.workers / workers
+            self.workers = workers
+            self.rate = self.configured_rate / workers
+            self.min_rate = self.configured_min_rate / workers
+            self.burst = max(1, self.configured_burst // workers)
+            for bucket in self._buckets.values():
+                bucket.rate *= scale
+                bucket.burst = self.burst
+        logger.info("Sharing host rate limits between %s workers: %.3f req/s per host each", workers, self.rate)
+
+    def reserve(self, url, at=None):
+        """Reserve a request slot for url, returning the monotonic time at which it may be sent"""
+        with self._lock:
+            return self._bucket(self.host_for(url)).reserve(time.monotonic() if at is None else at)
+
+    def observe(self, url, status_code, retry_after=None):
+        """Feed a response back into the limiter for its host"""
+        host = self.host_for(url)
+        now = time.monotonic()
+        throttled = status_code in THROTTLE_STATUS_CODES
+
+        with self._lock:
+            bucket = self._bucket(host)
+            outcomes = self._outcomes[host]
+            outcomes.append(throttled)
+
+            if throttled:
+                delay = parse_retry_after(retry_after)
+                if delay:
+                    bucket.blocked_until = max(bucket.blocked_until, now + delay)
+                    logger.warning(f"{host} answered {status_code}, pausing requests for {delay:.0f}s")
+
+            throttle_rate = sum(outcomes) / len(outcomes)
+            if throttle_rate > self.throttle_threshold:
+                if now - self._last_decrease.get(host, 0) >= self.decrease_cooldown and bucket.rate > self.min_rate:
+                    bucket.rate = max(self.min_rate, bucket.rate / 2)
+                    self._last_decrease[host] = now
+                    logger.warning(f"{host} throttled {throttle_rate:.0%} of recent requests, "
+                                   f"slowing to {bucket.rate:.3f} req/s")
+            elif not throttled and bucket.rate < self.rate:
+                # Additive recovery towards the configured rate
+                bucket.rate = min(self.rate, bucket.rate + self.rate / self.window)
+
+    def get_status(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                host: {
+                    'rate': round(bucket.rate, 3),
+                    'throttled': round(sum(self._outcomes[host]) / len(self._outcomes[host]), 3)
+                    if self._outcomes[host] else 0,
+                    'blocked_for': round(max(0.0, bucket.blocked_until - now), 1)
+                }
+                for host, bucket in self._buckets.items()
+            }
@@ -0,0 +1,69 @@
+# render_cache.py
+"""
+Render cache for the dashboard pages.
+
+A page is stored with the data version it was rendered from and the time it stops being valid
+(for example when a displayed countdown rolls over). Requests with the same version before that time
+get the stored string; otherwise one request renders the page again while concurrent requests wait
+for its result instead of rendering it as well. Values derived from table rows, such as display
+strings for dates, are kept per row and only recomputed when the row's change_seq moves.
+"""
+import threading
+import time
+
+
+class RenderCache:
+    """Rendered pages by name, each valid for one data version and until its expiry time"""
+
+    def __init__(self):
+        self._pages = {}
+        self._page_locks = {}
+        self._lock = threading.Lock()
+
+    def _fresh(self, name, version):
+        entry = self._pages.get(name)
+        if entry is not None and entry[0] == version and time.time() < entry[2]:
+            return entry[1]
+        return None
+
+    def get_or_render(self, name, version, render):
+        """
+        The page name rendered from version if it is cached and unexpired, otherwise the result of
+        render(), which returns the page and the epoch time until which it may be served.
+        """
+        page = self._fresh(name, version)
+        if page is not None:
+            return page
+
+        with self._lock:
+            page_lock = self._page_locks.setdefault(name, threading.Lock())
+        with page_lock:
+            # Another request may have rendered it while this one waited
+            page = self._fresh(name, version)
+            if page is not None:
+                return page
+            page, expires_at = render()
+            self._pages[name] = (version, page, expires_at)
+            return page
+
+
+class RowCache:
+    """Values built from rows by build(row), rebuilt only for rows whose change_seq changed"""
+
+    def __init__(self, build):
+        self._build = build
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def get(self, rows):
+        """Built values for rows, in the same order. Rows not passed are forgotten"""
+        with self._lock:
+            cached = self._rows
+            current = {}
+            for row in rows:
+                entry = cached.get(row['id'])
+                if entry is None or entry[0] != row['change_seq']:
+                    entry = (row['change_seq'], self._build(row))
+                current[row['id']] = entry
+            self._rows = current
+            return [current[row['id']][1] for row in rows]
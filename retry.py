@@ -0,0 +1,79 @@
+# retry.py
+import random
+import re
+
+# Failure kinds
+PROXY = 'proxy'
+TARGET = 'target'
+PARSE = 'parse'
+
+# curl error codes that point at the proxy or the connection through it rather than the target site:
+# 5 couldn't resolve proxy, 7 couldn't connect, 28 timeout, 35 TLS handshake, 52 empty reply,
+# 55/56 send/receive failure, 97 proxy handshake
+PROXY_CURL_CODES = {5, 7, 28, 35, 52, 55, 56, 97}
+CURL_CODE_PATTERN = re.compile(r'curl: \((\d+)\)')
+
+PARSE_ERRORS = ("Download button not found", "No href in download button")
+
+
+def classify_failure(error=None, status_code=None, message=None):
+    """
+    Classify a failed access as proxy-level, target-level or parse-level.
+    error is the exception raised by the request, status_code the HTTP status of the response
+    and message the worker's own error message.
+    """
+    if message in PARSE_ERRORS:
+        return PARSE
+
+    if status_code is not None:
+        # 407 Proxy Authentication Required comes from the proxy itself
+        return PROXY if status_code == 407 else TARGET
+
+    if error is not None:
+        text = str(error)
+        if 'proxy' in type(error).__name__.lower() or 'proxy' in text.lower():
+            return PROXY
+        match = CURL_CODE_PATTERN.search(text)
+        if match:
+            return PROXY if int(match.group(1)) in PROXY_CURL_CODES else TARGET
+        if 'timeout' in type(error).__name__.lower() or 'timed out' in text.lower():
+            return PROXY
+
+    return TARGET
+
+
+def describe_error(error):
+    """
+    Stable label for an exception raised by an access, such as "curl error 28" or "ProxyError".
+    The exception text carries details like addresses and byte counts that make nearly every
+    message unique, so only the label is stored with the access log.
+    """
+    match = CURL_CODE_PATTERN.search(str(error))
+    if match:
+        return f"curl error {match.group(1)}"
+    return type(error).__name__
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff per failure kind, capped at max_attempts per view slot.
+    Proxy failures retry quickly on another proxy, target failures back off longer so the host
+    can recover, and parse failures get a single slow retry since a changed page rarely fixes itself.
+    """
+
+    BASE_MULTIPLIER = {PROXY: 1, TARGET: 6, PARSE: 30}
+
+    def __init__(self, max_attempts=3, base_delay=10, max_delay=900, parse_max_attempts=2):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.parse_max_attempts = min(parse_max_attempts, max_attempts)
+
+    def next_delay(self, kind, attempt):
+        """Seconds to wait before the next attempt after attempt failed, or None to give up"""
+        limit = self.parse_max_attempts if kind == PARSE else self.max_attempts
+        if attempt >= limit:
+            return None
+        ceiling = min(self.max_delay, self.base_delay * self.BASE_MULTIPLIER[kind] * 2 ** (attempt - 1))
+        # Equal jitter: keep half of the backoff and randomize the rest
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
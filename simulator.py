@@ -0,0 +1,279 @@
+# simulator.py
+"""
+Time-warp simulation of the access scheduler.
+
+Runs the real LinkWorker scheduling code (process_pending_accesses, cycle rollover, proxy
+cooldowns, leases) against a simulated clock, with the HTTP stages stubbed out so an access
+completes instantly. The accesses still write their logs, proxy usage and view counts to the
+database, because the report checks every link's accesses per cycle against the 120 view cap and
+against the views the database counted. That caps the replay at a few thousand accesses per second:
+1,000 links over 61 days take about 30 seconds, while 100,000 links (about 14 million accesses)
+take close to an hour.
+"""
+import heapq
+import logging
+import statistics
+import time
+from array import array
+from collections import Counter
+
+from db_models import Database
+from link_state import VIEWS_PER_CYCLE, access_offset, accesses_due
+from proxy_pool import ProxySource
+from timestamps import DAY_SECONDS, set_clock
+from worker import LinkWorker, _Access
+
+logger = logging.getLogger(__name__)
+
+PROXY_COOLDOWN_SECONDS = 24 * 3600
+
+
+class SimulatedClock:
+    """Clock that only moves when advanced, in epoch seconds"""
+
+    def __init__(self, start):
+        self.time = float(start)
+
+    def __call__(self):
+        return self.time
+
+    def advance(self, seconds):
+        self.time += seconds
+
+    def advance_to(self, time):
+        self.time = max(self.time, time)
+
+
+class SimulatedWorker(LinkWorker):
+    """
+    LinkWorker whose accesses run inline and skip the network: stages run back to back instead of
+    waiting in the delay queue, and the page and download requests are replaced by a successful result.
+    Catch-up accesses wait on a heap of simulated times that the simulation runs between ticks.
+    Every access is checked against the ideal access curve and the 24 hour proxy cooldown.
+    """
+
+    def __init__(self, db, clock, proxy_count, tick_seconds):
+        super().__init__(db)
+        self.clock = clock
+        self.tick_interval = tick_seconds
+        self.proxy_source.stop()
+        self.proxy_source = ProxySource(proxies=[f"http://sim-proxy-{index}:8080" for index in range(proxy_count)])
+        self.catch_ups = []
+        # Nothing is parsed, so don't keep parser processes around
+        if self.parse_pool is not None:
+            self.parse_pool.shutdown(wait=False)
+            self.parse_pool = None
+
+        self.accesses = 0
+        self.cycle_accesses = Counter()
+        self.direct_accesses = 0
+        self.access_seconds = 0.0
+        self.drift = array('d')
+        self.hourly_accesses = Counter()
+        self.proxy_last_used = {}
+        self.reuse_violations = 0
+
+    def start_access(self, link_id, url, slot=None, cycle=None):
+        started = time.perf_counter()
+        access = _Access(link_id, url, slot, cycle)
+        with self.task_lock:
+            self.in_flight += 1
+        self._run_stage(access, self._access_prepare)
+        self.access_seconds += time.perf_counter() - started
+        return access.future
+
+    def _next_stage(self, access, stage, delay, request_url):
+        # Pauses and rate limits are not simulated: run the next stage right away
+        self._run_stage(access, stage)
+
+    def _schedule_catch_up(self, delay, link_id, next_at):
+        heapq.heappush(self.catch_ups, (next_at, link_id))
+
+    def run_catch_ups(self, until):
+        """Advance the clock through the catch-up accesses due by until, running each at its time"""
+        while self.catch_ups and self.catch_ups[0][0] <= until:
+            next_at, link_id = heapq.heappop(self.catch_ups)
+            self.clock.advance_to(next_at)
+            self._catch_up_link(link_id, next_at)
+
+    def _access_page(self, access):
+        """Stubbed page and download requests: record what the access looked like and complete it"""
+        now = self.clock()
+        link = self.db.get_link(access.link_id)
+        cycle_start = link['current_cycle_start']
+        ideal = cycle_start + access_offset(link['current_period_views'], link['current_cycle_end'] - cycle_start)
+        self.drift.append(now - ideal)
+        self.hourly_accesses[int(now // 3600)] += 1
+        self.accesses += 1
+        self.cycle_accesses[access.link_id, link['current_cycle']] += 1
+        if not access.proxy:
+            self.direct_accesses += 1
+
+        key = (access.link_id, access.proxy)
+        last_used = self.proxy_last_used.get(key)
+        if last_used is not None and now - last_used < PROXY_COOLDOWN_SECONDS:
+            self.reuse_violations += 1
+        self.proxy_last_used[key] = now
+
+        self._complete_access(access, 200)
+
+
+def _seed_links(db, link_count, start, stagger_seconds):
+    """Insert link_count links whose cycles start spread evenly over stagger_seconds from start"""
+    if db.execute_raw_query("SELECT EXISTS (SELECT 1 FROM links)")[0][0]:
+        raise ValueError(f"{db.db_name} already has links; the simulation needs an empty database")
+    rows = []
+    for index in range(link_count):
+        cycle_start = int(start + stagger_seconds * index / link_count)
+        rows.append((f"https://sim.invalid/link/{index}", cycle_start, cycle_start,
+                     cycle_start + 60 * DAY_SECONDS, 1))
+    with db.lock:
+        conn = db.get_connection()
+        conn.executemany(
+            "INSERT INTO links (url, date_added, current_cycle_start, current_cycle_end, current_cycle) "
+            "VALUES (?, ?, ?, ?, ?)", rows)
+        conn.commit()
+        db.links_version += 1
+
+
+def _summary(values, scale=1):
+    if not values:
+        return {'mean': None, 'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(values)
+    return {
+        'mean': round(statistics.fmean(ordered) * scale, 3),
+        'p50': round(ordered[len(ordered) // 2] * scale, 3),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * scale, 3),
+        'max': round(ordered[-1] * scale, 3)
+    }
+
+
+def _check_views(worker, views_counted, period_views):
+    """
+    Compare the accesses the worker made with the views the database counted: no link may get more
+    than VIEWS_PER_CYCLE accesses in a cycle, every access counts exactly one view, and each link's
+    period views match its accesses in the current cycle. Accesses over a direct connection (no proxies
+    loaded, e.g. proxy_count=0) are held to the same checks and reported separately.
+    """
+    period_mismatches = sum(1 for row in period_views
+                            if row['current_period_views'] != worker.cycle_accesses[row['id'], row['current_cycle']])
+    return {
+        'max_cycle_accesses': max(worker.cycle_accesses.values(), default=0),
+        'cycles_over_cap': sum(1 for count in worker.cycle_accesses.values() if count > VIEWS_PER_CYCLE),
+        'views_minus_accesses': views_counted - worker.accesses,
+        'direct_accesses': worker.direct_accesses,
+        'period_view_mismatches': period_mismatches
+    }
+
+
+def run_simulation(link_count=1000, days=61, tick_seconds=300, proxy_count=50, stagger_hours=24,
+                   db_name=":memory:"):
+    """
+    Simulate days of scheduling for link_count links, ticking every tick_seconds of simulated time.
+    Returns a report with the scheduler cost per tick (excluding the stubbed accesses), accesses per
+    simulated hour, drift of each access behind its ideal time, and proxy reuse within the cooldown.
+    """
+    wall_started = time.perf_counter()
+    # A private database per run, so a second run in the same process doesn't see the first one's links
+    db = Database(db_name)
+    clock = SimulatedClock(time.time())
+    set_clock(clock)
+    try:
+        _seed_links(db, link_count, clock(), stagger_hours * 3600)
+        worker = SimulatedWorker(db, clock, proxy_count, tick_seconds)
+
+        tick_costs = array('d')
+        end = clock() + days * DAY_SECONDS
+        try:
+            while clock() < end:
+                next_tick = clock() + tick_seconds
+                worker.run_catch_ups(next_tick)
+                clock.advance_to(next_tick)
+                access_seconds = worker.access_seconds
+                started = time.perf_counter()
+                worker.process_pending_accesses()
+                tick_costs.append(time.perf_counter() - started - (worker.access_seconds - access_seconds))
+        finally:
+            worker.shutdown()
+
+        cycles = db.execute_raw_query("SELECT current_cycle, COUNT(*) AS links FROM links GROUP BY current_cycle")
+        views_counted = db.execute_raw_query("SELECT COALESCE(SUM(total_views), 0) FROM links")[0][0]
+        period_views = db.execute_raw_query("SELECT id, current_cycle, current_period_views FROM links")
+    finally:
+        set_clock(None)
+        db.close()
+
+    hourly = list(worker.hourly_accesses.values())
+    simulated_hours = days * 24
+    return {
+        'links': link_count,
+        'days': days,
+        'ticks': len(tick_costs),
+        'proxies': proxy_count,
+        'accesses': worker.accesses,
+        'views_counted': views_counted,
+        'tick_ms': _summary(tick_costs, 1000),
+        'accesses_per_hour': {
+            'mean': round(worker.accesses / simulated_hours, 1),
+            'peak': max(hourly, default=0)
+        },
+        'drift_seconds': _summary(worker.drift),
+        'proxy_reuse_violations': worker.reuse_violations,
+        'view_checks': _check_views(worker, views_counted, period_views),
+        'links_per_cycle': {row['current_cycle']: row['links'] for row in cycles},
+        'wall_seconds': round(time.perf_counter() - wall_started, 1)
+    }
+
+
+def check_catch_up(views_behind=30, window_minutes=None, tick_seconds=60, proxy_count=50, db_name=":memory:"):
+    """
+    Start one link views_behind accesses behind its curve and tick until it has caught up, or until
+    the catch-up window (CATCHUP_WINDOW_MINUTES unless window_minutes is given) has passed.
+    Returns how long recovery took in simulated seconds, or None if the link was still behind.
+    """
+    if not 1 <= views_behind < VIEWS_PER_CYCLE:
+        raise ValueError(f"views_behind must be between 1 and {VIEWS_PER_CYCLE - 1}")
+    db = Database(db_name)
+    clock = SimulatedClock(time.time())
+    set_clock(clock)
+    try:
+        # The link's first views_behind accesses are due, and none has been made yet
+        cycle_seconds = 60 * DAY_SECONDS
+        cycle_start = clock() - access_offset(views_behind - 1, cycle_seconds) - 1
+        _seed_links(db, 1, cycle_start, 0)
+        worker = SimulatedWorker(db, clock, proxy_count, tick_seconds)
+        if window_minutes is not None:
+            worker.catchup_window = window_minutes * 60
+
+        def caught_up():
+            views = db.execute_raw_query("SELECT current_period_views FROM links")[0][0]
+            return accesses_due(clock() - cycle_start, cycle_seconds) <= views
+
+        started = clock()
+        deadline = started + worker.catchup_window
+        recovery_seconds = None
+        try:
+            next_tick = started
+            while next_tick <= deadline:
+                clock.advance_to(next_tick)
+                worker.process_pending_accesses()
+                next_tick += tick_seconds
+                # Catch-up accesses until the next tick; the clock stops at the last one
+                if not caught_up():
+                    worker.run_catch_ups(min(next_tick, deadline))
+                if caught_up():
+                    recovery_seconds = clock() - started
+                    break
+        finally:
+            worker.shutdown()
+    finally:
+        set_clock(None)
+        db.close()
+
+    return {
+        'views_behind': views_behind,
+        'window_seconds': worker.catchup_window,
+        'accesses': worker.accesses,
+        'recovery_seconds': None if recovery_seconds is None else round(recovery_seconds),
+        'proxy_reuse_violations': worker.reuse_violations
+    }
@@ -0,0 +1,49 @@
+# timestamps.py
+"""
+Timestamps are stored as integer epoch seconds.
+
+These helpers convert between that storage format, datetimes and the text timestamps
+('%Y-%m-%d %H:%M:%S[.%f]', local time) that databases from before schema version 4 hold.
+"""
+import time
+from datetime import datetime
+
+DAY_SECONDS = 24 * 60 * 60
+CYCLE_SECONDS = 60 * DAY_SECONDS
+
+# Source of the current time for scheduling and storage; the simulator swaps in a simulated clock
+_clock = time.time
+
+
+def set_clock(clock=None):
+    """Replace the clock used by current_time() and now_ts() with a callable returning epoch seconds (None restores time.time)"""
+    global _clock
+    _clock = clock or time.time
+
+
+def current_time():
+    """Current time as epoch seconds"""
+    return _clock()
+
+
+def now_ts():
+    """Current time as integer epoch seconds"""
+    return int(_clock())
+
+
+def to_epoch(value):
+    """Convert a stored timestamp (epoch number, datetime or legacy text) to epoch seconds"""
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f' if '.' in value else '%Y-%m-%d %H:%M:%S').timestamp()
+
+
+def to_datetime(value):
+    """Convert a stored timestamp to a local datetime, or None if it is empty"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromtimestamp(to_epoch(value))
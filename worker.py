@@ -3,52 +3,531 @@ import random
 import time
 import os
 import math
+import socket
+import uuid
 import logging
 from datetime import datetime, timedelta
-from db_models import Database
-from curl_cffi import requests as curl_requests
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
+from db_models import get_database, shard_for
+from delay_queue import DelayQueue
+from concurrency import ConcurrencyController
+from rate_limit import HostRateLimiter
+from retry import RetryPolicy, classify_failure, describe_error, PARSE
+from link_state import LinkStateTable, accesses_due
+from backup import BACKUP_CLAIM_TTL, BACKUP_JOB, create_backup_manager
+from purge import create_purger
+from proxy_pool import ProxySource, parse_proxy_list
+from logging_config import get_access_logger
+from timestamps import current_time, to_epoch, to_datetime
 import concurrent.futures
-from threading import Lock
+import multiprocessing
+import parsers
+from threading import Lock, Event, Thread
 
 
 logger = logging.getLogger(__name__)
+# Messages logged on every access, sampled by logging_config
+access_logger = get_access_logger(__name__)
+
+
+ACCESS_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:135.0) Gecko/20100101 Firefox/135.0",
+    "Accept": "*/*",
+    "Accept-Language": "pt-BR,pt;q=0.8,en-US;q=0.5,en;q=0.3",
+    "Accept-Encoding": "gzip, deflate, br, zstd",
+    "Connection": "keep-alive",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-origin",
+    "Pragma": "no-cache",
+    "Cache-Control": "no-cache",
+    "TE": "trailers",
+}
+
+
+class _Access:
+    """State of one link access as it moves through its stages"""
+    __slots__ = ('link_id', 'url', 'slot', 'cycle', 'proxy', 'session', 'download_url', 'future', 'started_at', 'delayed',
+                 'attempt', 'failed_proxies', 'bytes_in', 'bytes_out')
+
+    def __init__(self, link_id, url, slot=None, cycle=None, attempt=1):
+        self.link_id = link_id
+        self.url = url
+        # (link_id, view_index) and cycle of a scheduled access, None for forced ones
+        self.slot = slot
+        self.cycle = cycle
+        self.future = concurrent.futures.Future()
+        self.attempt = attempt
+        self.failed_proxies = set()
+        self.reset_attempt()
+
+    def reset_attempt(self):
+        """Clear the per-attempt state before a retry"""
+        self.started_at = time.monotonic()
+        # Seconds spent in deliberate pauses, excluded from the measured latency
+        self.delayed = 0.0
+        self.proxy = None
+        self.session = None
+        self.download_url = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+
+def _available_cpus():
+    """Number of CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _new_session():
+    """Create an HTTP session. curl_cffi is imported on first use so importing the worker stays cheap"""
+    from curl_cffi import requests as curl_requests
+    return curl_requests.Session()
 
 
 class LinkWorker:
-    def __init__(self):
-        self.db = Database()
-        # Get proxies from HTTP_PROXIES environment variable
-        self.proxies = self._get_proxies()
+    def __init__(self, db=None):
+        self.db = db or get_database()
+        # Proxy pool from PROXY_FILE (a file or directory, reloaded when it changes) or HTTP_PROXIES
+        self.proxy_source = self._create_proxy_source()
         if not self.proxies:
-            logger.warning("No proxies were loaded. Check HTTP_PROXIES environment variable.")
+            logger.warning("No proxies were loaded. Check the PROXY_FILE or HTTP_PROXIES environment variable.")
 
             # Thread pool for concurrent processing
         self.max_workers = int(os.environ.get('MAX_WORKER_THREADS', 5))
         self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        # Timer for the pauses between access stages
+        self.delay_queue = DelayQueue(self.executor)
+
+        # Adaptive limit on in-flight accesses. Pauses don't hold a thread, so it can exceed the thread count.
+        self.concurrency = ConcurrencyController(
+            floor=int(os.environ.get('ACCESS_CONCURRENCY_MIN', 2)),
+            ceiling=int(os.environ.get('ACCESS_CONCURRENCY_MAX', self.max_workers * 4)),
+            latency_target=float(os.environ.get('ACCESS_LATENCY_TARGET_SECONDS', 20)),
+            error_threshold=float(os.environ.get('ACCESS_ERROR_THRESHOLD', 0.2))
+        )
+        self.in_flight = 0
+        self.backlog = 0
+
+        # Catch-up mode: links that fell behind their access curve make up their missing accesses within
+        # CATCHUP_WINDOW_MINUTES, never spaced further apart than a tick, and as fast as
+        # CATCHUP_MIN_INTERVAL_SECONDS while there is capacity to spare. The window sets the pace for
+        # deficits of more than one access per tick over the window (20 views with the defaults)
+        self.catchup_enabled = os.environ.get('CATCHUP_ENABLED', '1') not in ('0', 'false', 'False')
+        self.catchup_window = float(os.environ.get('CATCHUP_WINDOW_MINUTES', 20)) * 60
+        self.catchup_min_interval = float(os.environ.get('CATCHUP_MIN_INTERVAL_SECONDS', 5))
+        # Epoch time each catching-up link's next access is paced for, and the time it should have caught up by
+        self.catchup_next_at = {}
+        self.catchup_deadlines = {}
+        # Seconds between scheduler ticks and between status reports, set by run()
+        self.tick_interval = 60
+        self.poll_interval = 5
+
+        # Bandwidth: how the download hop is sent (get, head or range) and whether page bodies are cut short
+        self.download_hop_mode = os.environ.get('DOWNLOAD_HOP_MODE', 'range').lower()
+        if self.download_hop_mode not in ('get', 'head', 'range'):
+            raise ValueError(f"DOWNLOAD_HOP_MODE must be get, head or range, not {self.download_hop_mode}")
+        self.page_early_abort = os.environ.get('PAGE_EARLY_ABORT', '1') not in ('0', 'false', 'False')
+
+        # Retries for failed accesses, queued on the delay queue with jittered exponential backoff
+        self.retry_policy = RetryPolicy(
+            max_attempts=int(os.environ.get('RETRY_MAX_ATTEMPTS', 3)),
+            base_delay=float(os.environ.get('RETRY_BASE_SECONDS', 10)),
+            max_delay=float(os.environ.get('RETRY_MAX_SECONDS', 900))
+        )
+        self.retries_pending = 0
+        # Attempts used and the monotonic time the next may start, per (link_id, view_index) slot of
+        # the current cycle, so the tick doesn't start a slot over while it backs off. A slot that gave up
+        # cools down for RETRY_MAX_SECONDS, in every worker through its lease, and then gets a fresh attempt budget
+        self.slot_attempts = {}
+
+        # Per-host rate limits shared by every outbound request, split between the live workers
+        self.rate_limiter = HostRateLimiter(
+            rate=float(os.environ.get('HOST_RATE_PER_SECOND', 1.0)),
+            burst=int(os.environ.get('HOST_BURST', 5)),
+            min_rate=float(os.environ.get('HOST_MIN_RATE_PER_SECOND', 0.05)),
+            throttle_threshold=float(os.environ.get('HOST_THROTTLE_THRESHOLD', 0.1))
+        )
+
+        # Process pool for HTML parsing so parses are not serialized by the GIL.
+        # PARSER_PROCESSES=0 parses in the calling thread instead.
+        self.parser_processes = int(os.environ.get('PARSER_PROCESSES', _available_cpus()))
+        self.parse_pool = None
+        if self.parser_processes > 0:
+            # Don't fork a process that already runs threads; forkserver/spawn children only import parsers
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.parse_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.parser_processes,
+                mp_context=multiprocessing.get_context(start_method)
+            )
+        # Scheduled online backups of the database, taken on a background thread
+        self.backups = create_backup_manager(self.db.db_name)
+
         self.active_tasks = {}
         self.task_lock = Lock()
+        # Scheduling state of the active links, kept in memory between ticks
+        self.link_states = LinkStateTable()
+
+        # Lease settings so several worker processes can share the same database
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.lease_ttl = int(os.environ.get('LEASE_TTL_SECONDS', 300))
+        self.shard_count = max(1, int(os.environ.get('WORKER_SHARD_COUNT', 1)))
+        self.shard_index = int(os.environ.get('WORKER_SHARD_INDEX', 0))
+        if not 0 <= self.shard_index < self.shard_count:
+            raise ValueError(f"WORKER_SHARD_INDEX must be between 0 and {self.shard_count - 1}")
+        # Removes the rows of links deleted from the dashboard, on a background thread
+        self.purger = create_purger(self.db, self._owns_link)
+        self.held_leases = {}
+        self.task_started = {}
+        self.started_at = time.time()
+        self.stop_event = Event()
+        self.lease_thread = Thread(target=self._renew_leases, daemon=True)
+        self.lease_thread.start()
+
+        logger.info(f"Initialized LinkWorker {self.worker_id} with {self.max_workers} worker threads, "
+                    f"{self.parser_processes} parser processes (shard {self.shard_index + 1}/{self.shard_count})")
+
+    def _create_proxy_source(self):
+        """Load proxies from PROXY_FILE and watch it for changes, or fall back to HTTP_PROXIES"""
+        proxy_file = os.environ.get('PROXY_FILE')
+        if proxy_file:
+            source = ProxySource(proxy_file, check_interval=float(os.environ.get('PROXY_RELOAD_SECONDS', 10)))
+            source.start()
+            return source
+
+        proxy_string = os.environ.get('HTTP_PROXIES', '')
+        if not proxy_string:
+            logger.warning("HTTP_PROXIES environment variable is not set")
+            return ProxySource()
+
+        # Handles both comma-separated and newline-separated formats
+        source = ProxySource(proxies=parse_proxy_list(proxy_string))
+        logger.info(f"Loaded {len(source.pool)} proxies from HTTP_PROXIES environment variable")
+        return source
+
+    @property
+    def proxies(self):
+        """The current proxy pool"""
+        return self.proxy_source.pool
+
+    def _parse(self, parse_function, *args):
+        """
+        Run a parsers function in the parser pool and wait for its result.
+        Raw response bytes are passed as-is, so the page is never decoded in the I/O thread.
+        """
+        if self.parse_pool is None:
+            return parse_function(*args)
+        return self.parse_pool.submit(parse_function, *args).result()
+
+    def _owns_link(self, link_id):
+        """Check whether this worker's shard is responsible for a link"""
+        return shard_for(link_id, self.shard_count) == self.shard_index
+
+    def _renew_leases(self):
+        """Periodically extend the leases of accesses that are still running and reclaim expired ones"""
+        interval = max(1, self.lease_ttl // 3)
+        while not self.stop_event.wait(interval):
+            self.db.reclaim_expired_leases()
+
+            with self.task_lock:
+                leases = list(self.held_leases.items())
+
+            for task_id, (link_id, view_index) in leases:
+                if not self.db.renew_lease(link_id, view_index, self.worker_id, self.lease_ttl):
+                    logger.warning(f"Lost lease for task {task_id}; another worker may pick it up")
+
+    def _slot_waiting(self, link_id, view_index, now_monotonic):
+        """Check whether a view slot is backing off after a failure or cooling down after giving up"""
+        state = self.slot_attempts.get((link_id, view_index))
+        return state is not None and state[2] > now_monotonic
+
+    def _prune_slot_attempts(self):
+        """Forget the attempts of slots whose link has moved to another cycle or is no longer active"""
+        for slot, (cycle, _, _) in list(self.slot_attempts.items()):
+            if self.link_states.cycle_of(slot[0]) != cycle:
+                self.slot_attempts.pop(slot, None)
+
+    def _start_leased_access(self, task_id, link_id, view_index, cycle, url):
+        """Start an access while holding its lease, releasing the lease once it finishes"""
+        def release(future):
+            with self.task_lock:
+                self.held_leases.pop(task_id, None)
+            self.db.release_lease(link_id, view_index, self.worker_id)
+
+        future = self.start_access(link_id, url, (link_id, view_index), cycle)
+        future.add_done_callback(release)
+        return future
 
-        logger.info(f"Initialized LinkWorker with {self.max_workers} worker threads")
+    def _start_due_access(self, task_id, link, catch_up_interval=None):
+        """
+        Claim and start the next due access of a link. With catch_up_interval set, a successful access
+        schedules the link's next overdue access that many seconds later instead of waiting for a tick.
+        """
+        # Claim the access so no other worker process runs it
+        view_index = link['current_period_views']
+        if not self.db.claim_lease(link['id'], view_index, self.worker_id, self.lease_ttl):
+            return False
+
+        with self.task_lock:
+            access_logger.info("Scheduling access for link %s (ID: %s), views: %s in cycle %s",
+                               link['url'], link['id'], view_index, link['current_cycle'])
+            self.held_leases[task_id] = (link['id'], view_index)
+
+        # Start the access on the thread pool
+        future = self._start_leased_access(task_id, link['id'], view_index, link['current_cycle'], link['url'])
+        self._track_task(task_id, future)
+
+        if catch_up_interval is None:
+            self._end_catch_up(link['id'])
+        else:
+            def catch_up(future):
+                if future.result() and not self.stop_event.is_set():
+                    # With capacity to spare the next access doesn't wait for its paced time
+                    idle = not self.backlog and self.in_flight < self.concurrency.limit
+                    delay = self.catchup_min_interval if idle else catch_up_interval
+                    next_at = current_time() + delay
+                    self.catchup_next_at[link['id']] = next_at
+                    self._schedule_catch_up(delay, link['id'], next_at)
+                else:
+                    self._end_catch_up(link['id'])
+            future.add_done_callback(catch_up)
+        return True
 
-    def _get_proxies(self):
-        """Get proxies from HTTP_PROXIES environment variable"""
+    def _catch_up_interval(self, link_id, deficit):
+        """
+        Spacing between the accesses of a link that is deficit accesses behind, or None if it isn't behind.
+        The remaining accesses are spread over what is left of the link's recovery window, but never
+        further apart than a tick, so catching up is never slower than one access per tick.
+        """
+        if not self.catchup_enabled or deficit <= 1:
+            return None
+        now = current_time()
+        deadline = self.catchup_deadlines.setdefault(link_id, now + self.catchup_window)
+        return max(self.catchup_min_interval, min(self.tick_interval, (deadline - now) / deficit))
+
+    def _end_catch_up(self, link_id):
+        """Forget the catch-up state of a link, which then waits for the regular tick"""
+        self.catchup_next_at.pop(link_id, None)
+        self.catchup_deadlines.pop(link_id, None)
+
+    def _schedule_catch_up(self, delay, link_id, next_at):
+        """Run the next catch-up access of a link after delay seconds"""
+        self.delay_queue.call_later(delay, self._catch_up_link, link_id, next_at)
+
+    def _catch_up_link(self, link_id, next_at):
+        """Start the next overdue access of a link that is catching up, if there is room for it"""
+        # A tick started the link's access meanwhile, which paced a newer one
+        if self.catchup_next_at.get(link_id) != next_at:
+            return
+        # Without free capacity or a fresh proxy the link waits for the regular tick instead
+        if self.in_flight >= self.concurrency.limit:
+            return
+        link = self.db.get_link(link_id)
+        if not link or not link['active'] or link['current_period_views'] >= 120:
+            self._end_catch_up(link_id)
+            return
+
+        cycle_start = to_epoch(link['current_cycle_start'])
+        cycle_seconds = to_epoch(link['current_cycle_end']) - cycle_start
+        deficit = accesses_due(current_time() - cycle_start, cycle_seconds) - link['current_period_views']
+        if deficit <= 0:
+            self._end_catch_up(link_id)
+            return
+
+        proxies = self.proxies
+        if proxies and not proxies.count_free(self.db.get_recent_proxies_for_link(link_id, 24)):
+            access_logger.info("Pausing catch-up for link ID %s: every proxy was used for it in the last 24 hours", link_id)
+            return
+
+        if self._slot_waiting(link_id, link['current_period_views'], time.monotonic()):
+            self._end_catch_up(link_id)
+            return
+
+        task_id = f"link_{link_id}_{link['current_period_views']}"
+        with self.task_lock:
+            if task_id in self.active_tasks:
+                return
+        self._start_due_access(task_id, link, self._catch_up_interval(link_id, deficit))
+
+    def shutdown(self):
+        """Stop renewing leases and hand unfinished work back to other workers"""
+        self.stop_event.set()
+        self.proxy_source.stop()
+        self.delay_queue.stop()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.parse_pool is not None:
+            # Wait for the parser processes to exit: a worker running in a multiprocessing child joins its
+            # children before the executor's exit hook would stop them, so leaving them running hangs the exit
+            self.parse_pool.shutdown(wait=True, cancel_futures=True)
+        released = self.db.release_leases_for_owner(self.worker_id)
+        self.db.remove_worker_status(self.worker_id)
+        logger.info(f"Worker {self.worker_id} shut down, released {released} leases")
+
+    def run(self, tick_interval=60, poll_interval=5):
+        """
+        Run the worker loop until shutdown.
+        Pending accesses are scheduled every tick_interval seconds, while commands from
+        the web process and the status heartbeat are handled every poll_interval seconds.
+        """
+        logger.info(f"Worker {self.worker_id} running (tick {tick_interval}s, poll {poll_interval}s)")
+        self.tick_interval = tick_interval
+        self.poll_interval = poll_interval
+        # Report before the first tick so the host rate limits are already split with the other workers
+        self.publish_status()
+        next_tick = 0
+        while not self.stop_event.is_set():
+            try:
+                self.process_commands()
+                # Tick early when due accesses are waiting and the concurrency limit has room again
+                has_room = self.backlog and self.in_flight < self.concurrency.limit
+                if time.time() >= next_tick or has_room:
+                    self.process_pending_accesses()
+                    next_tick = time.time() + tick_interval
+                self.publish_status()
+                # Workers sharing the database take turns: only the one holding the claim backs up
+                if self.backups.is_due() and self.db.claim_job(BACKUP_JOB, self.worker_id, BACKUP_CLAIM_TTL):
+                    Thread(target=self._run_backup, name="backup", daemon=True).start()
+                if not self.purger.running and self.purger.pending():
+                    Thread(target=self._run_purge, name="purge", daemon=True).start()
+            except Exception as e:
+                logger.error(f"Error in worker loop: {e}")
+            self.stop_event.wait(poll_interval)
+
+    def _run_backup(self):
+        """Take a scheduled backup, comparing access latency during it with the p95 before it"""
         try:
-            proxy_string = os.environ.get('HTTP_PROXIES', '')
-            if not proxy_string:
-                logger.warning("HTTP_PROXIES environment variable is not set")
-                return []
+            self.backups.run(baseline_latency=self.concurrency.p95_latency())
+        except Exception as e:
+            logger.error(f"Scheduled backup failed: {e}")
+        finally:
+            self.db.release_job(BACKUP_JOB, self.worker_id)
+        self.publish_status()
 
-                # Split the string into individual proxies
-            # Handles both comma-separated and newline-separated formats
-            proxies = [p.strip() for p in proxy_string.replace('\n', ',').split(',') if p.strip()]
+    def _run_purge(self):
+        """Remove the rows of links deleted from the dashboard"""
+        try:
+            self.purger.run()
+        except Exception as e:
+            logger.error(f"Purging deleted links failed: {e}")
+        self.publish_status()
+
+    def process_commands(self):
+        """Run commands queued by the web process"""
+        for command in self.db.claim_commands(self.worker_id):
+            try:
+                self.handle_command(command['command'], command['payload'])
+                self.db.complete_command(command['id'])
+            except Exception as e:
+                logger.error(f"Worker command {command['command']} ({command['id']}) failed: {e}")
+                self.db.complete_command(command['id'], str(e))
+
+    def handle_command(self, command, payload):
+        """Dispatch a single queued command"""
+        if command == 'force_run':
+            link_id = payload['link_id']
+            link = self.db.get_link(link_id)
+            if not link or link['deleted_at'] is not None:
+                raise ValueError(f"Link ID {link_id} not found")
+            self._track_task(f"force_{link_id}_{int(time.time())}", self.start_access(link_id, link['url']))
+        elif command == 'add_url':
+            self._track_task(f"add_{int(time.time() * 1000)}", self.import_url(payload['url']))
+        else:
+            raise ValueError(f"Unknown worker command: {command}")
+
+    def _track_task(self, task_id, future):
+        """Register a future so it shows up in active tasks"""
+        with self.task_lock:
+            self.active_tasks[task_id] = future
+            self.task_started[task_id] = datetime.now()
+
+    def _when_host_allows(self, request_url, function, *args):
+        """Run function(*args) on the thread pool once the rate limiter has a slot for request_url's host"""
+        self.delay_queue.call_at(self.rate_limiter.reserve(request_url), function, *args)
+
+    def import_url(self, url):
+        """
+        Add a URL, expanding directory listings, and extract metadata for the new links.
+        Each request waits for its host's rate limit in the delay queue rather than on a thread.
+        Returns a Future that resolves to the number of links added.
+        """
+        future = concurrent.futures.Future()
+        self._when_host_allows(url, self._import_listing, url, future)
+        return future
 
-            logger.info(f"Loaded {len(proxies)} proxies from HTTP_PROXIES environment variable")
-            return proxies
+    def _import_listing(self, url, future):
+        """Add the links of a URL, then queue a metadata request for each new one"""
+        try:
+            added = self._add_links(url, self.check_and_extract_links(url))
         except Exception as e:
-            logger.error(f"Error parsing HTTP_PROXIES: {e}")
-            return []
+            future.set_exception(e)
+            return
+        future.set_result(len(added))
+
+        for link_url, link_id in added:
+            self._when_host_allows(link_url, self.extract_metadata, link_url, link_id)
+
+    def _add_links(self, url, link_urls):
+        """Add the links found at url, skipping duplicates. Returns the (url, id) of each added link"""
+        added = []
+        duplicate_count = 0
+        deleting_count = 0
+        for link_url in link_urls:
+            existing = self.db.get_link_by_url(link_url)
+            if existing and existing['deleted_at'] is not None:
+                # The URL's row stays until the purger has removed its history; it can be added again after that
+                deleting_count += 1
+                logger.warning(f"Skipping link that is still being deleted, add it again once it is purged: {link_url}")
+                continue
+            if existing:
+                duplicate_count += 1
+                logger.info(f"Skipping duplicate link: {link_url}")
+                continue
+
+            added.append((link_url, self.db.add_link(link_url)))
+
+        logger.info(f"Imported {url}: added {len(added)} links, skipped {duplicate_count} duplicates"
+                    + (f" and {deleting_count} links still being deleted" if deleting_count else ""))
+        return added
+
+    def get_status(self):
+        """Collect the worker state shown on the status page"""
+        with self.task_lock:
+            tasks = [{
+                'id': task_id,
+                'status': 'Running' if not future.done() else 'Completed',
+                'start_time': self.task_started[task_id].strftime('%Y-%m-%d %H:%M:%S')
+                if task_id in self.task_started else 'Unknown'
+            } for task_id, future in self.active_tasks.items()]
+
+        return {
+            'active_workers': sum(1 for task in tasks if task['status'] == 'Running'),
+            'max_workers': self.max_workers,
+            'parser_processes': self.parser_processes,
+            'delayed_stages': len(self.delay_queue),
+            'in_flight': self.in_flight,
+            'backlog': self.backlog,
+            'retries_pending': self.retries_pending,
+            'catching_up': len(self.catchup_next_at),
+            'links_tracked': len(self.link_states),
+            'concurrency': self.concurrency.get_status(),
+            'hosts': self.rate_limiter.get_status(),
+            'backup': self.backups.get_status(),
+            'purge': self.purger.get_status(),
+            'proxies_loaded': len(self.proxies),
+            'proxy_source': self.proxy_source.get_status(),
+            'shard': f"{self.shard_index + 1}/{self.shard_count}",
+            'tasks': tasks
+        }
+
+    def publish_status(self):
+        """
+        Write this worker's status to the database for the web process, and split the host rate limits
+        between the workers that reported recently, this one included
+        """
+        self.db.update_worker_status(self.worker_id, socket.gethostname(), os.getpid(),
+                                     self.started_at, self.get_status())
+        self.rate_limiter.set_share(self.db.count_live_workers(max(30, 3 * self.poll_interval)))
 
     def _calculate_access_times(self, start_date, end_date, total_accesses=120):
         """
@@ -74,74 +553,29 @@ class LinkWorker:
         """
         Check if URL contains a table with class="fs" and extract direct links.
         Returns a list of links. If no fs table, returns a list with just the original URL.
+        The caller waits for the host's rate limit first.
         """
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:135.0) Gecko/20100101 Firefox/135.0",
-                "Accept": "*/*",
-                "Accept-Language": "pt-BR,pt;q=0.8,en-US;q=0.5,en;q=0.3",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Connection": "keep-alive",
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-origin",
-                "Pragma": "no-cache",
-                "Cache-Control": "no-cache",
-                "TE": "trailers",
-            }
-
             logger.info(f"Checking URL for directory listing: {url}")
 
             # Visit the page
-            session = curl_requests.Session()
+            session = _new_session()
             response = session.get(
                 url,
-                headers=headers,
+                headers=ACCESS_HEADERS,
                 timeout=30,
                 impersonate="firefox135"
             )
+            self._observe_response(url, response)
 
-            # Parse the HTML
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Check if there's a table with class="fs"
-            fs_table = soup.find('table', class_='fs')
-
-            if fs_table:
+            # Parse the listing in a parser process
+            direct_links = self._parse(parsers.parse_listing, response.content, url, response.encoding)
+            if direct_links:
                 logger.info(f"Found directory listing table in {url}")
+                logger.info(f"Extracted {len(direct_links)} direct links from {url}")
+                return direct_links
 
-                # Find all links with target="_blank" and non-empty href
-                direct_links = []
-                for link in fs_table.find_all('a', target='_blank', href=True):
-                    href = link.get('href')
-                    if href and not href.startswith('#') and not href == '/':
-                        # Make sure the URL is absolute
-                        if not href.startswith('http'):
-                            # Parse the original URL to get the base
-                            parsed_url = urlparse(url)
-                            base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
-
-                            # If href starts with /, it's relative to the domain root
-                            if href.startswith('/'):
-                                full_url = f"{base_url}{href}"
-                            else:
-                                # Otherwise it's relative to the current path
-                                path_parts = parsed_url.path.split('/')
-                                # Remove the last part if it's not empty
-                                if path_parts[-1]:
-                                    path_parts = path_parts[:-1]
-                                base_path = '/'.join(path_parts)
-                                full_url = f"{base_url}{base_path}/{href}"
-
-                            direct_links.append(full_url)
-                        else:
-                            direct_links.append(href)
-
-                if direct_links:
-                    logger.info(f"Extracted {len(direct_links)} direct links from {url}")
-                    return direct_links
-
-                    # If no fs table or no links found, return the original URL
+            # If no fs table or no links found, return the original URL
             return [url]
         except Exception as e:
             logger.error(f"Error checking URL {url}: {e}")
@@ -149,53 +583,26 @@ class LinkWorker:
             return [url]
 
     def extract_metadata(self, url, link_id=None):
-        """Extract filename and file details from the link page"""
+        """Extract filename and file details from the link page. The caller waits for the host's rate limit first"""
         try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:135.0) Gecko/20100101 Firefox/135.0",
-                "Accept": "*/*",
-                "Accept-Language": "pt-BR,pt;q=0.8,en-US;q=0.5,en;q=0.3",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Connection": "keep-alive",
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-origin",
-                "Pragma": "no-cache",
-                "Cache-Control": "no-cache",
-                "TE": "trailers",
-            }
-
             logger.info(f"Extracting metadata from URL: {url}")
 
             # Visit the page
-            session = curl_requests.Session()
+            session = _new_session()
             response = session.get(
                 url,
-                headers=headers,
+                headers=ACCESS_HEADERS,
                 timeout=30,
                 impersonate="firefox135"
             )
+            self._observe_response(url, response)
 
-            # Parse the HTML and find metadata
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Extract filename from span with class "text-2xl"
-            filename_span = soup.find('span', class_='text-2xl')
-            filename = filename_span.get_text().strip() if filename_span else "Unknown Filename"
+            # Parse the HTML in a parser process and find metadata
+            page = self._parse(parsers.parse_link_page, response.content, response.encoding)
+            filename = page['filename']
+            file_details = page['file_details']
 
-            # Extract file details from the 3rd list item sibling to this span
-            file_details = "No details available"
-            if filename_span:
-                # Find the parent element and then the ul tag
-                parent = filename_span.parent
-                ul_tag = parent.find('ul')
-                if ul_tag:
-                    # Get the 3rd list item
-                    li_items = ul_tag.find_all('li')
-                    if len(li_items) >= 3:
-                        file_details = li_items[2].get_text().strip()
-
-            logger.info(f"Extracted filename: '{filename}' and details: '{file_details}'")
+            access_logger.info("Extracted filename: '%s' and details: '%s'", filename, file_details)
 
             # Store the data if link_id is provided
             if link_id:
@@ -212,23 +619,14 @@ class LinkWorker:
         Schedule accesses for a link over current 45 days cycle
         Returns a list of datetime objects when the link should be accessed
         """
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute("""  
-            SELECT current_cycle_start, current_cycle_end   
-            FROM links   
-            WHERE id = ?  
-        """, (link_id,))
-
-        link_data = cursor.fetchone()
+        link_data = self.db.get_link(link_id)
 
         if not link_data:
             logger.error(f"Link ID {link_id} not found in database")
             return []
 
-        start_date = datetime.strptime(link_data['current_cycle_start'], '%Y-%m-%d %H:%M:%S.%f')
-        end_date = datetime.strptime(link_data['current_cycle_end'], '%Y-%m-%d %H:%M:%S.%f')
+        start_date = to_datetime(link_data['current_cycle_start'])
+        end_date = to_datetime(link_data['current_cycle_end'])
 
         # Calculate the next 100 access times for this cycle
         access_times = self._calculate_access_times(start_date, end_date)
@@ -237,148 +635,295 @@ class LinkWorker:
         return access_times
 
     def access_link(self, link_id, url):
-        """Access a link and follow the download button with proxy rotation"""
+        """
+        Access a link and wait for the result.
+        Only for callers outside the worker's thread pool; pool tasks must use start_access.
+        """
+        return self.start_access(link_id, url).result()
+
+    def start_access(self, link_id, url, slot=None, cycle=None):
+        """
+        Access a link and follow the download button with proxy rotation.
+        The access runs as a chain of stages on the thread pool, and the human-like pauses between
+        stages wait in the delay queue, so no thread is parked in time.sleep.
+        slot is the (link_id, view_index) of a scheduled access in cycle, whose attempts carry over
+        between accesses of the same slot.
+        Returns a Future that resolves to True if the access succeeded.
+        """
+        state = self.slot_attempts.get(slot)
+        attempt = state[1] + 1 if state is not None and state[0] == cycle else 1
+        access = _Access(link_id, url, slot, cycle, attempt)
+        with self.task_lock:
+            self.in_flight += 1
+        self.executor.submit(self._run_stage, access, self._access_prepare)
+        return access.future
+
+    def _run_stage(self, access, stage):
+        """Run one access stage, turning any exception into a failed attempt"""
         try:
-            logger.info(f"Accessing link {url} (ID: {link_id})")
-
-            # Get unused proxies for this link (with 24 hour cooldown)
-            unused_proxies = self.db.get_unused_proxies_for_link(link_id, self.proxies, 24)
-
-            # Choose a proxy
-            proxy = None
-            proxies = None
-
-            if unused_proxies:
-                proxy = random.choice(unused_proxies)
-                proxies = {"http": proxy, "https": proxy}
-                logger.info(f"Using proxy {proxy} for link ID {link_id}")
-            elif self.proxies:
-                # If all proxies have been used, reuse one of the existing proxies
-                proxy = random.choice(self.proxies)
-                proxies = {"http": proxy, "https": proxy}
-                logger.warning(
-                    f"All proxies have been used for link ID {link_id} within cooldown period. Reusing {proxy}")
+            stage(access)
+        except Exception as e:
+            # The full message goes to the log; the access log stores its stable label
+            logger.error("Error accessing %s: %s", access.url, e)
+            self._fail_access(access, classify_failure(error=e), None, describe_error(e))
+
+    def _fail_access(self, access, kind, status_code, message):
+        """
+        Log a failed attempt and either queue a retry on another proxy after a jittered
+        backoff, or give up once the view slot has used up its attempts
+        """
+        self.db.log_access(access.link_id, access.proxy, status_code, message, failure_kind=kind,
+                           bytes_in=access.bytes_in, bytes_out=access.bytes_out)
+
+        delay = self.retry_policy.next_delay(kind, access.attempt)
+        if access.slot is not None:
+            if delay is None:
+                # Give up for now: the slot is due again after the longest backoff, with its attempts reset.
+                # Its lease is kept through the cooldown so other workers don't start it over either
+                self.slot_attempts[access.slot] = (access.cycle, 0, time.monotonic() + self.retry_policy.max_delay)
+                self.db.cool_down_lease(*access.slot, self.worker_id, current_time() + self.retry_policy.max_delay)
             else:
-                logger.warning(f"No proxies available for link ID {link_id}. Using direct connection.")
-
-                # Record the proxy usage
-            if proxy:
-                self.db.record_proxy_usage(link_id, proxy)
-
-                # Actual link access code
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:135.0) Gecko/20100101 Firefox/135.0",
-                "Accept": "*/*",
-                "Accept-Language": "pt-BR,pt;q=0.8,en-US;q=0.5,en;q=0.3",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Connection": "keep-alive",
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-origin",
-                "Pragma": "no-cache",
-                "Cache-Control": "no-cache",
-                "TE": "trailers",
-            }
-
-            # Add some randomization to appear more human-like
-            time.sleep(random.uniform(1, 3))
-
-            logger.info(f"Accessing URL: {url}")
-
-            # Step 1: Visit the main page
-            session = curl_requests.Session()
-            if proxies:
-                session.proxies = proxies
+                self.slot_attempts[access.slot] = (access.cycle, access.attempt, time.monotonic() + delay)
+
+        if delay is None or self.stop_event.is_set():
+            logger.warning("Giving up on link ID %s after %s attempts (%s failure: %s)",
+                           access.link_id, access.attempt, kind, message)
+            self._finish_access(access, False)
+            return
+
+        logger.info("Retrying link ID %s in %.0fs after %s failure (attempt %s of %s): %s", access.link_id, delay,
+                    kind, access.attempt, self.retry_policy.max_attempts, message)
+
+        # The slot is given back while the retry waits in the delay queue
+        self.concurrency.record(time.monotonic() - access.started_at - access.delayed, False)
+        with self.task_lock:
+            self.in_flight -= 1
+            self.retries_pending += 1
+        if access.proxy:
+            access.failed_proxies.add(access.proxy)
+        if access.session is not None:
+            access.session.close()
+        access.reset_attempt()
+        self.delay_queue.call_later(delay, self._run_stage, access, self._access_retry)
+
+    def _access_retry(self, access):
+        """Start the next attempt of a failed access"""
+        with self.task_lock:
+            self.in_flight += 1
+            self.retries_pending -= 1
+        access.attempt += 1
+        access.started_at = time.monotonic()
+        self._access_prepare(access)
+
+    def _next_stage(self, access, stage, delay, request_url):
+        """
+        Run the next stage of an access once delay seconds have passed and the
+        target host's rate limiter has a slot for the request the stage will send
+        """
+        now = time.monotonic()
+        send_at = self.rate_limiter.reserve(request_url, now + delay)
+        access.delayed += send_at - now
+        self.delay_queue.call_at(send_at, self._run_stage, access, stage)
+
+    def _observe_response(self, url, response):
+        """Report a response to the rate limiter so throttling slows down requests to its host"""
+        self.rate_limiter.observe(url, response.status_code, response.headers.get('Retry-After'))
+
+    def _finish_access(self, access, result):
+        if access.session is not None:
+            access.session.close()
+        if not access.future.done():
+            latency = time.monotonic() - access.started_at - access.delayed
+            self.concurrency.record(latency, result)
+            self.backups.observe_latency(latency)
+            with self.task_lock:
+                self.in_flight -= 1
+            access.future.set_result(result)
 
-            response = session.get(
-                url,
-                headers=headers,
+    def _read_page(self, response):
+        """
+        Read a streamed page body. With PAGE_EARLY_ABORT on, the transfer is cut as soon as the
+        markup the parser needs has arrived; otherwise, or if it never shows up, the whole page is read.
+        """
+        body = bytearray()
+        try:
+            for chunk in response.iter_content(chunk_size=16384):
+                body += chunk
+                if self.page_early_abort and parsers.has_required_markup(body):
+                    break
+        finally:
+            response.close()
+        return bytes(body)
+
+    @staticmethod
+    def _count_bytes(access, method, url, response, body_bytes):
+        """
+        Add a request/response pair to the access's byte counters.
+        curl's own transfer sizes are used when the response exposes them, otherwise they are estimated
+        from the request line, headers and the body bytes actually read.
+        """
+        header_size = getattr(response, 'header_size', None)
+        if not header_size:
+            header_size = len(f"HTTP/1.1 {response.status_code}\r\n") + 2 + sum(
+                len(name) + len(value) + 4 for name, value in response.headers.items())
+        download_size = getattr(response, 'download_size', None)
+        access.bytes_in += header_size + (download_size if download_size else body_bytes)
+
+        request_size = getattr(response, 'request_size', None)
+        if not request_size:
+            request_size = len(f"{method} {url} HTTP/1.1\r\n") + 2 + sum(
+                len(name) + len(value) + 4 for name, value in ACCESS_HEADERS.items())
+        access.bytes_out += request_size
+
+    def _access_prepare(self, access):
+        """Stage 1: choose a proxy for the link"""
+        link_id = access.link_id
+        access_logger.info("Accessing link %s (ID: %s)", access.url, link_id)
+
+        # Read the pool once so a reload can't swap it mid-choice
+        proxies = self.proxies
+
+        # Choose a proxy not used for this link in the last 24 hours that hasn't already failed this access
+        recent_proxies = self.db.get_recent_proxies_for_link(link_id, 24)
+        access.proxy = proxies.choose(recent_proxies | access.failed_proxies)
+        if access.proxy:
+            access_logger.info("Using proxy %s for link ID %s", access.proxy, link_id)
+        elif proxies:
+            # If all proxies have been used, reuse one of the existing proxies, preferably one that hasn't failed
+            access.proxy = proxies.choose(access.failed_proxies) or proxies.choose()
+            # Once a link has used every proxy this happens on each of its accesses, so it is sampled
+            access_logger.info("All proxies have been used for link ID %s within cooldown period. Reusing %s",
+                               link_id, access.proxy)
+        else:
+            # Startup already warns that no proxies were loaded
+            access_logger.info("No proxies available for link ID %s. Using direct connection.", link_id)
+
+        # Record the proxy usage
+        if access.proxy:
+            self.db.record_proxy_usage(link_id, access.proxy)
+
+        # Add some randomization to appear more human-like
+        self._next_stage(access, self._access_page, random.uniform(1, 3), access.url)
+
+    def _access_page(self, access):
+        """Stage 2: visit the link page and find the download button"""
+        url = access.url
+        link_id = access.link_id
+        access_logger.info("Accessing URL: %s", url)
+
+        # Visit the main page
+        access.session = _new_session()
+        if access.proxy:
+            access.session.proxies = {"http": access.proxy, "https": access.proxy}
+
+        response = access.session.get(
+            url,
+            headers=ACCESS_HEADERS,
+            timeout=30,
+            impersonate="firefox135",
+            stream=True
+        )
+        body = self._read_page(response)
+        self._count_bytes(access, 'GET', url, response, len(body))
+        self._observe_response(url, response)
+
+        if response.status_code >= 400:
+            self._fail_access(access, classify_failure(status_code=response.status_code), response.status_code,
+                              f"Page request failed with HTTP {response.status_code}")
+            return
+
+        # Parse the HTML in a parser process and find the download button and file information
+        page = self._parse(parsers.parse_link_page, body, response.encoding)
+        filename = page['filename']
+        file_details = page['file_details']
+
+        # Store the filename and file details in the database
+        self.db.update_link_info(link_id, filename, file_details)
+        access_logger.info("Extracted filename: '%s' and details: '%s'", filename, file_details)
+
+        if not page['has_download_button']:
+            logger.error("Could not find download button on %s", url)
+            self._fail_access(access, PARSE, response.status_code, "Download button not found")
+            return
+
+        download_url = page['download_url']
+        if not download_url:
+            logger.error("Download button found but no href attribute on %s", url)
+            self._fail_access(access, PARSE, response.status_code, "No href in download button")
+            return
+
+        # Make sure the URL is absolute
+        if not download_url.startswith('http'):
+            if download_url.startswith('/'):
+                # Extract domain from original URL
+                parts = url.split('/')
+                base_url = f"{parts[0]}//{parts[2]}"
+                download_url = base_url + download_url
+            else:
+                # Relative URL, append to the path
+                download_url = url + '/' + download_url
+
+        access_logger.info("Found download URL: %s", download_url)
+        access.download_url = download_url
+
+        # Simulate human delay before clicking the button
+        self._next_stage(access, self._access_download, random.uniform(2, 5), download_url)
+
+    def _access_download(self, access):
+        """Stage 3: follow the download button but don't download the file"""
+        access.session.headers["Referer"] = access.url
+        if self.download_hop_mode == 'head':
+            method = 'HEAD'
+            response = access.session.head(
+                access.download_url,
+                headers=ACCESS_HEADERS,
                 timeout=30,
                 impersonate="firefox135"
             )
-
-            # Step 2: Parse the HTML and find the download button and file information
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Extract filename from span with class "text-2xl"
-            filename_span = soup.find('span', class_='text-2xl')
-            filename = filename_span.get_text().strip() if filename_span else "Unknown Filename"
-
-            # Extract file details from the 3rd list item sibling to this span
-            file_details = "No details available"
-            if filename_span:
-                # Find the parent element and then the ul tag
-                parent = filename_span.parent
-                ul_tag = parent.find('ul')
-                if ul_tag:
-                    # Get the 3rd list item
-                    li_items = ul_tag.find_all('li')
-                    if len(li_items) >= 3:
-                        file_details = li_items[2].get_text().strip()
-
-                        # Store the filename and file details in the database
-            self.db.update_link_info(link_id, filename, file_details)
-            logger.info(f"Extracted filename: '{filename}' and details: '{file_details}'")
-
-            # Find the download button
-            download_button = soup.find('a', class_=lambda c: c and 'link-button' in c and 'gay-button' in c)
-
-            if not download_button:
-                logger.error(f"Could not find download button on {url}")
-                self.db.log_access(link_id, proxy, response.status_code, "Download button not found")
-                return False
-
-            download_url = download_button.get('hx-get')
-            if not download_url:
-                logger.error(f"Download button found but no href attribute on {url}")
-                self.db.log_access(link_id, proxy, response.status_code, "No href in download button")
-                return False
-
-                # Make sure the URL is absolute
-            if not download_url.startswith('http'):
-                if download_url.startswith('/'):
-                    # Extract domain from original URL
-                    parts = url.split('/')
-                    base_url = f"{parts[0]}//{parts[2]}"
-                    download_url = base_url + download_url
-                else:
-                    # Relative URL, append to the path
-                    download_url = url + '/' + download_url
-
-            logger.info(f"Found download URL: {download_url}")
-
-            # Step 3: Follow the download button but don't download the file
-            # We'll just send a HEAD request to register the click
-            time.sleep(random.uniform(2, 5))  # Simulate human delay
-            session.headers["Referer"] = url
-            response = session.get(
-                download_url,
+        else:
+            # 'range' asks for a single byte of the file; 'get' requests all of it and hangs up right away
+            method = 'GET'
+            headers = dict(ACCESS_HEADERS, Range='bytes=0-0') if self.download_hop_mode == 'range' else ACCESS_HEADERS
+            response = access.session.get(
+                access.download_url,
                 headers=headers,
                 timeout=30,
                 impersonate="firefox135",
                 stream=True
             )
-            response.close()
+        response.close()
+        self._count_bytes(access, method, access.download_url, response, 0)
+        self._observe_response(access.download_url, response)
 
-            # Log the access
-            self.db.log_access(link_id, proxy, response.status_code)
-            logger.info(f"Successfully accessed download link for {url}, status code: {response.status_code}")
+        if response.status_code >= 400:
+            self._fail_access(access, classify_failure(status_code=response.status_code), response.status_code,
+                              f"Download request failed with HTTP {response.status_code}")
+            return
 
-            # After successful access, increment the view count
-            self.db.increment_link_views(link_id)
+        self._complete_access(access, response.status_code)
 
-            return True
-        except Exception as e:
-            logger.error(f"Error accessing {url}: {e}")
-            self.db.log_access(link_id, proxy, None, str(e))
-            return False
+    def _complete_access(self, access, status_code):
+        """Record a successful access and resolve its future"""
+        # Log the access, which counts the view in the same transaction
+        self.db.log_access(access.link_id, access.proxy, status_code,
+                           bytes_in=access.bytes_in, bytes_out=access.bytes_out)
+        access_logger.info("Successfully accessed download link for %s, status code: %s", access.url, status_code)
+
+        if access.slot is not None:
+            self.slot_attempts.pop(access.slot, None)
+        self._finish_access(access, True)
 
     def process_pending_accesses(self):
         """Process all links and perform any pending accesses"""
         try:
             logger.info("Starting to process pending accesses")
-            active_links = self.db.get_active_links()
-            now = datetime.now()
+
+            # Refresh the in-memory link state; this only reads links if something changed
+            now = current_time()
+            self.link_states.refresh(self.db)
+            if self.link_states.needs_rollover(now, self._owns_link) and self.db.advance_cycles(self._owns_link):
+                self.link_states.refresh(self.db)
+            self._prune_slot_attempts()
 
             # Check for completed tasks and remove them
             with self.task_lock:
@@ -392,35 +937,45 @@ class LinkWorker:
                         logger.error(f"Task {task_id} failed: {e}")
                         # Remove the completed task
                     del self.active_tasks[task_id]
-
-            for link in active_links:
-                # Only process links that haven't completed their 100 accesses for the current cycle
-                if link['current_period_views'] < 120:
-                    # Calculate access times if not already done
-                    start_date = datetime.strptime(link['current_cycle_start'], '%Y-%m-%d %H:%M:%S.%f')
-                    end_date = datetime.strptime(link['current_cycle_end'], '%Y-%m-%d %H:%M:%S.%f')
-
-                    # Calculate access times for this cycle
-                    access_times = self._calculate_access_times(start_date, end_date)
-
-                    # Find the next scheduled access
-                    if link['current_period_views'] < len(access_times):
-                        next_access_time = access_times[link['current_period_views']]
-
-                        # If it's time to access the link
-                        if next_access_time <= now:
-                            # Check if we have an active task for this link
-                            task_id = f"link_{link['id']}_{link['current_period_views']}"
-
-                            with self.task_lock:
-                                if task_id not in self.active_tasks:
-                                    logger.info(f"Scheduling access for link {link['url']} (ID: {link['id']}), "
-                                                f"views: {link['current_period_views']} in cycle {link['current_cycle']}")
-
-                                    # Submit the task to the thread pool
-                                    future = self.executor.submit(self.access_link, link['id'], link['url'])
-                                    self.active_tasks[task_id] = future
-
-            logger.info(f"Completed scheduling pending accesses. Active tasks: {len(self.active_tasks)}")
+                    self.task_started.pop(task_id, None)
+
+            due_links = []
+            now_monotonic = time.monotonic()
+            for link_id, view_index, next_access_time, deficit in self.link_states.due(now, self._owns_link):
+                # Skip links whose catch-up pacing hasn't allowed the next access yet
+                if self.catchup_next_at.get(link_id, 0) > now:
+                    continue
+                # Skip slots waiting out a retry backoff or the cooldown after giving up
+                if self._slot_waiting(link_id, view_index, now_monotonic):
+                    continue
+
+                # Check if we have an active task for this link
+                task_id = f"link_{link_id}_{view_index}"
+                with self.task_lock:
+                    if task_id in self.active_tasks:
+                        continue
+
+                due_links.append((next_access_time, task_id, link_id, view_index, deficit))
+
+            # Let the concurrency controller size the number of in-flight accesses, most overdue first
+            due_links.sort(key=lambda item: item[0])
+            limit = self.concurrency.adjust(len(due_links), self.in_flight)
+
+            started = 0
+            for _, task_id, link_id, view_index, deficit in due_links:
+                if self.in_flight >= limit:
+                    break
+
+                # Skip links whose views moved on since the state was read (e.g. another worker ran the access)
+                link = self.db.get_link(link_id)
+                if not link or link['current_period_views'] != view_index:
+                    continue
+                if self._start_due_access(task_id, link, self._catch_up_interval(link_id, deficit)):
+                    started += 1
+
+            self.backlog = len(due_links) - started
+
+            logger.info("Completed scheduling pending accesses. Active tasks: %s, in flight: %s/%s, backlog: %s",
+                        len(self.active_tasks), self.in_flight, limit, self.backlog)
         except Exception as e:
-            logger.error(f"Error in process_pending_accesses: {e}")
\ No newline at end of file
+            logger.error(f"Error in process_pending_accesses: {e}")